@@ -1,15 +1,23 @@
 import sys
+import argparse
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtWidgets import QStyleFactory
 from scripts.pHstat_GUI import MainWindow
 
 def main():
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="pHStat")
+    parser.add_argument("--sim", action="store_true",
+                        help="run against a simulated plant instead of the I2C probes, MOSFET board and PPS")
+    parser.add_argument("--sim-speed", type=float, default=1.0,
+                        help="how much faster than real time the simulated plant evolves")
+    args, qt_args = parser.parse_known_args()
+
+    app = QApplication(sys.argv[:1] + qt_args)
     #print("Available styles:", QStyleFactory.keys())
     app.setStyle(QStyleFactory.create("Fusion"))  # ✅ This line forces a style that respects stylesheets
-    window = MainWindow()
+    window = MainWindow(simulate=args.sim, sim_speed=args.sim_speed)
     window.show()
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
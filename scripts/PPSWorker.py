@@ -1,5 +1,4 @@
 from PyQt5.QtCore import QObject, pyqtSignal
-from voltcraft.pps import PPS
 import time
 
 class PPSWorker(QObject):
@@ -9,10 +8,14 @@ class PPSWorker(QObject):
     mode_signal = pyqtSignal(str)
     disconnected_signal = pyqtSignal()
 
-    def __init__(self, port, interval, reset):
+    def __init__(self, port, interval, reset, pps=None):
         super().__init__()
         print(port)
-        self.pps = PPS(port,reset)
+        # pps: an already opened (or simulated) supply, otherwise one is opened on port
+        if pps is None:
+            from voltcraft.pps import PPS  # Not needed for a simulated supply
+            pps = PPS(port,reset)
+        self.pps = pps
         self.interval = interval
         self.failure_count = 0
         self.max_failures = 3  # Number of allowed failures before disconnect
@@ -1,51 +1,213 @@
-import io
+import os
 import fcntl
+import ctypes
+import threading
+import time
+
+I2C_RDWR = 0x0707
+I2C_M_RD = 0x0001
+
+# First byte of every EZO response
+EZO_SUCCESS = 1
+EZO_SYNTAX_ERROR = 2
+EZO_PENDING = 254
+EZO_NO_DATA = 255
+
+# Seconds an EZO circuit needs to answer "R", from the datasheets
+EZO_READ_DELAY = {
+    "PH": 0.9,
+    "ORP": 0.9,
+    "RTD": 0.6,
+    "EC": 0.6,
+    "DO": 0.6,
+}
+
+class EZOError(IOError):
+    """An EZO circuit answered with something other than a successful result."""
+    def __init__(self, status, message=None):
+        self.status = status
+        if message is None:
+            message = {
+                EZO_SYNTAX_ERROR: "syntax error",
+                EZO_PENDING: "still processing",
+                EZO_NO_DATA: "no data to send",
+            }.get(status, f"unknown response code {status}")
+        super().__init__(message)
+
+class i2c_msg(ctypes.Structure):
+    # struct i2c_msg from <linux/i2c.h>
+    _fields_ = [
+        ("addr", ctypes.c_uint16),
+        ("flags", ctypes.c_uint16),
+        ("len", ctypes.c_uint16),
+        ("buf", ctypes.POINTER(ctypes.c_char)),
+    ]
+
+class i2c_rdwr_ioctl_data(ctypes.Structure):
+    # struct i2c_rdwr_ioctl_data from <linux/i2c-dev.h>
+    _fields_ = [
+        ("msgs", ctypes.POINTER(i2c_msg)),
+        ("nmsgs", ctypes.c_uint32),
+    ]
+
+class I2CBus:
+    """One open /dev/i2c-<bus> descriptor shared by every device on that bus.
+
+    Transfers go through a single I2C_RDWR ioctl using buffers that are
+    allocated once, so a read followed by the next command costs one syscall.
+    """
+    max_bytes = 32
+    _buses = {}
+    _buses_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, bus):
+        with cls._buses_lock:
+            if bus not in cls._buses:
+                cls._buses[bus] = cls(bus)
+            instance = cls._buses[bus]
+            instance.users += 1
+            return instance
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.users = 0
+        self.fd = os.open("/dev/i2c-" + str(bus), os.O_RDWR)
+        # One extra byte that always stays 0 so the payload is NUL terminated
+        self.read_buf = ctypes.create_string_buffer(self.max_bytes + 1)
+        self.write_buf = ctypes.create_string_buffer(self.max_bytes)
+        self.read_ptr = ctypes.cast(self.read_buf, ctypes.POINTER(ctypes.c_char))
+        self.write_ptr = ctypes.cast(self.write_buf, ctypes.POINTER(ctypes.c_char))
+        self.msgs = (i2c_msg * 2)()
+        self.ioctl_data = i2c_rdwr_ioctl_data(self.msgs, 0)
+        self.lock = threading.Lock()  # Protects the shared buffers
+
+    def transfer(self, addr, data=None, num_of_bytes=0, read_first=False):
+        """Write *data* and/or read *num_of_bytes* from *addr* in one ioctl.
+
+        With read_first the read message goes before the write, which lets a
+        device hand over its last result and get its next command in the same
+        transaction. Returns (first byte, bytes up to the first NUL after it)
+        of the read, or None when nothing was read.
+        """
+        with self.lock:
+            write_msg = read_msg = None
+            if data:
+                length = len(data)
+                if length > self.max_bytes:
+                    raise ValueError(f"I2C write of {length} bytes exceeds {self.max_bytes}")
+                ctypes.memmove(self.write_buf, data, length)
+                write_msg = (addr, 0, length, self.write_ptr)
+            if num_of_bytes:
+                num_of_bytes = min(num_of_bytes, self.max_bytes)
+                ctypes.memset(self.read_buf, 0, self.max_bytes)
+                read_msg = (addr, I2C_M_RD, num_of_bytes, self.read_ptr)
+
+            order = (read_msg, write_msg) if read_first else (write_msg, read_msg)
+            count = 0
+            for msg in order:
+                if msg is None:
+                    continue
+                m = self.msgs[count]
+                m.addr, m.flags, m.len, m.buf = msg
+                count += 1
+            if not count:
+                return None
+            self.ioctl_data.nmsgs = count
+            fcntl.ioctl(self.fd, I2C_RDWR, self.ioctl_data)
+
+            if read_msg is None:
+                return None
+            status = ord(self.read_buf[0])
+            payload = ctypes.string_at(ctypes.addressof(self.read_buf) + 1)
+            return status, payload
+
+    def release(self):
+        with self._buses_lock:
+            self.users -= 1
+            if self.users <= 0:
+                self._buses.pop(self.bus, None)
+                os.close(self.fd)
 
 class atlas_i2c:
-    
+
     long_timeout = 1.5
     short_timeout = .3
+    min_poll = 0.01   # First retry after a "still processing" answer
+    max_poll = 0.1    # Backoff never waits longer than this between polls
     default_bus = 1
     #default_address = 100 #ORP
-    
+
     #102 RTD
     #98 ORP
-    
+
     def __init__(self,address, bus = default_bus):
-        self.file_read = io.open("/dev/i2c-" +str(bus),"rb",buffering = 0)
-        self.file_write = io.open("/dev/i2c-" +str(bus),"wb", buffering = 0)
+        self.bus = I2CBus.get(bus)
         self.set_i2c_address(address)
-    
+
     def set_i2c_address(self, addr):
-        I2C_SLAVE = 0x703
-        fcntl.ioctl(self.file_read, I2C_SLAVE, addr)
-        fcntl.ioctl(self.file_write, I2C_SLAVE, addr)
-    
+        # The address travels with every I2C_RDWR message, no I2C_SLAVE needed
+        self.address = addr
+
     def write(self, string):
         string +="\00"
-        self.file_write.write(string.encode('utf-8'))
-    
+        self.bus.transfer(self.address, string.encode('utf-8'))
+
+    def read_response(self, num_of_bytes = 31):
+        """Return (status, payload) where status is one of the EZO_* codes."""
+        status, payload = self.bus.transfer(self.address, num_of_bytes=num_of_bytes)
+        return status, payload.decode('utf-8')
+
     def read(self, num_of_bytes = 31):
-        res = self.file_read.read(num_of_bytes).decode('utf-8').replace('\x00', '').replace('\x01', '') 
-       
-        return res
-    
-    def query(self,string):
-        self.write(string)
-        
-        #if((string.upper().startswith("R")) or
-        #   (string.upper().startswith("CAL"))):
-        #    querytimer = time.time() + long_timeout
-        #    #time.sleep(self.long_timeout)
-        #else:
-        #    querytimer = time.time() + short_timeout
-            #time.sleep(self.short_timeout)
-        #if querytimer < time.time():
-        #return self.read()
-    def close(self):
-        self.file_read.close()
-        self.file_write.close()
+        status, payload = self.read_response(num_of_bytes)
+        if status != EZO_SUCCESS:
+            raise EZOError(status)
+        return payload
+
+    def exchange_response(self, string, num_of_bytes = 31):
+        """Read the result of the previous command and send *string* in one transaction.
 
-#Creating the GUI
+        The command is sent whatever the answer was, so only use this when the
+        previous command is expected to be finished.
+        """
+        string +="\00"
+        status, payload = self.bus.transfer(self.address, string.encode('utf-8'), num_of_bytes, read_first=True)
+        return status, payload.decode('utf-8')
+
+    def exchange(self, string, num_of_bytes = 31):
+        status, payload = self.exchange_response(string, num_of_bytes)
+        if status != EZO_SUCCESS:
+            raise EZOError(status)
+        return payload
+
+    def read_delay(self, kind):
+        return EZO_READ_DELAY.get(kind.upper(), self.long_timeout - 0.5)
+
+    def timeout_for(self, string):
+        if string.upper().startswith(("R", "CAL")):
+            return self.long_timeout
+        return self.short_timeout
 
-#Creating the main GUI
+    def poll(self, timeout, num_of_bytes = 31):
+        """Read until the circuit has finished, backing off between attempts."""
+        deadline = time.monotonic() + timeout
+        wait = self.min_poll
+        while True:
+            status, payload = self.read_response(num_of_bytes)
+            if status == EZO_SUCCESS:
+                return payload
+            if status != EZO_PENDING:
+                raise EZOError(status)
+            if time.monotonic() + wait > deadline:
+                raise EZOError(status, f"still processing after {timeout:.2f} s")
+            time.sleep(wait)
+            wait = min(wait * 2, self.max_poll)
+
+    def query(self, string, timeout = None):
+        self.write(string)
+        if timeout is None:
+            timeout = self.timeout_for(string)
+        return self.poll(timeout)
+
+    def close(self):
+        self.bus.release()
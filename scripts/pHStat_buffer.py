@@ -0,0 +1,61 @@
+import numpy as np
+
+class ChannelBuffer:
+    """Fixed-capacity history of (time, value) pairs for one channel.
+
+    Every sample is stored twice, at i and i + capacity, so the latest n
+    samples are always one contiguous slice: append is O(1) and window()
+    returns views into the arrays without copying.
+    """
+
+    def __init__(self, capacity=2**17):
+        self.capacity = capacity
+        self.times = np.zeros(2 * capacity)
+        self.values = np.zeros(2 * capacity)
+        self.head = 0   # Next slot to write, in [0, capacity)
+        self.count = 0  # Number of valid samples, at most capacity
+        self.total = 0  # Samples appended since the last clear, never wraps
+
+    def __len__(self):
+        return self.count
+
+    def append(self, time, value):
+        i = self.head
+        self.times[i] = self.times[i + self.capacity] = time
+        self.values[i] = self.values[i + self.capacity] = value
+        self.head = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+        self.total += 1
+
+    def extend(self, times, values):
+        """Append many samples at once, only the latest capacity of them are kept."""
+        appended = len(times)
+        times = np.asarray(times, dtype=float)[-self.capacity:]
+        values = np.asarray(values, dtype=float)[-self.capacity:]
+        n = len(times)
+        if n == 0:
+            return
+        slots = (self.head + np.arange(n)) % self.capacity
+        self.times[slots] = self.times[slots + self.capacity] = times
+        self.values[slots] = self.values[slots + self.capacity] = values
+        self.head = (self.head + n) % self.capacity
+        self.count = min(self.count + n, self.capacity)
+        self.total += appended
+
+    def window(self, n=None):
+        """Return views (times, values) of the latest n samples, oldest first."""
+        if n is None or n > self.count:
+            n = self.count
+        end = self.head + self.capacity
+        return self.times[end - n:end], self.values[end - n:end]
+
+    def last(self, default=None):
+        if not self.count:
+            return default
+        return self.values[self.head - 1 + self.capacity]
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+        self.total = 0
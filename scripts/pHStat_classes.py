@@ -1,8 +1,10 @@
 from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QDateTimeEdit, QPushButton, 
-                             QWidget, QHBoxLayout, QSpinBox, QLabel, QComboBox, QDoubleSpinBox, QLineEdit, QCheckBox, QHBoxLayout, QSizePolicy)
+                             QWidget, QHBoxLayout, QSpinBox, QLabel, QComboBox, QDoubleSpinBox, QLineEdit, QCheckBox, QHBoxLayout, QSizePolicy,
+                             QPlainTextEdit)
 from PyQt5.QtCore import QEvent, Qt, QDateTime, pyqtSignal, QObject, QTimer, QSize, QPoint, QRectF, QPointF, QRect, pyqtSlot as Slot, pyqtProperty as Property
 from PyQt5.QtGui import QPainter, QColor, QFont, QFontMetrics, QCursor, QPen, QPaintEvent, QBrush
 from scripts.pHStat_worker import StatWorker
+from scripts.pHStat_telemetry import telemetry
 import os
 import math
 import time
@@ -14,10 +16,10 @@ class monoTimer:
         self.last_lap_time = None
         self.running = False
 
-    def start(self):
-        """Start or restart the timer."""
+    def start(self, offset=0.0):
+        """Start or restart the timer, elapsed() counts on from offset seconds."""
         now = time.monotonic()
-        self.start_time = now
+        self.start_time = now - offset
         self.last_lap_time = now
         self.running = True
         print("Timer started.")
@@ -280,39 +282,34 @@ class CalibratepHDialog(QDialog):
     def updateInfo(self, newInfo):
         self.commandline.setText(newInfo)
 
-class pumpControl(QObject):
-    pumpActivated = pyqtSignal(bool)
-    pumpDeactivated = pyqtSignal(bool)
-    cooldownEnded = pyqtSignal()
+class DiagnosticsDialog(QDialog):
+    """Live view of the I2C bus telemetry, refreshed every second while open."""
 
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.test = False
-        self.active_timer = QTimer(self)
-        self.active_timer.setSingleShot(True)
-        self.active_timer.timeout.connect(self.deactivate_feature)
-
-        self.cooldown_timer = QTimer(self)
-        self.cooldown_timer.setSingleShot(True)
-        self.cooldown_timer.timeout.connect(self.end_cooldown)
-
-    def activate_feature(self, duration_ms, cooldown_ms, test):
-        self.test = test
-        if not self.active_timer.isActive() and not self.cooldown_timer.isActive():
-            self.pumpActivated.emit(self.test)
-            
-            #PumpON
-            self.active_timer.start(duration_ms)
-            self.cooldown_duration = cooldown_ms
+    def __init__(self):
+        super().__init__(flags=Qt.WindowCloseButtonHint)
+        self.setWindowTitle('I2C diagnostics')
+        self.setGeometry(200, 50, 520, 420)
+        layout = QVBoxLayout(self)
+
+        self.report = QPlainTextEdit()
+        self.report.setReadOnly(True)
+        self.report.setFont(QFont("Monospace", 9))
+        layout.addWidget(self.report)
+
+        self.refreshTimer = QTimer(self)
+        self.refreshTimer.timeout.connect(self.refresh)
 
-    def deactivate_feature(self):
-        self.pumpDeactivated.emit(self.test)
-        #PumpOFF
-        self.cooldown_timer.start(self.cooldown_duration)
+    def refresh(self):
+        self.report.setPlainText(telemetry.format_report())
 
-    def end_cooldown(self):
-        self.cooldownEnded.emit()
+    def showEvent(self, event):
+        self.refresh()
+        self.refreshTimer.start(1000)
+        super().showEvent(event)
 
+    def hideEvent(self, event):
+        self.refreshTimer.stop()
+        super().hideEvent(event)
 
 class DatePickerDialog(QDialog):
     def __init__(self):
@@ -638,22 +635,22 @@ class ToggleSwitch(QCheckBox):
 
 class MockLib8MosInd:
     def __init__(self):
-        self.state = [0] * 8  # simulate 8 MOSFETs
+        self.state = [0] * 8  # simulate 8 MOSFETs, index 0 is MOSFET 1
         self.pwm = [0] * 8
         print("[MOCK] Initialized MockLib8MosInd")
 
     def set(self, stack, mosfet, value):
-        self.state[mosfet] = value
+        self.state[mosfet - 1] = 1 if value else 0
         print(f"[MOCK] set(stack={stack}, mosfet={mosfet}, value={value})")
 
     def get(self, stack, mosfet):
-        print(f"[MOCK] get(stack={stack}, mosfet={mosfet}) => {self.state[mosfet]}")
-        return self.state[mosfet]
+        print(f"[MOCK] get(stack={stack}, mosfet={mosfet}) => {self.state[mosfet - 1]}")
+        return self.state[mosfet - 1]
 
     def set_all(self, stack, value):
-        val = 1 if value else 0
-        self.state = [val] * 8
-        print(f"[MOCK] set_all(stack={stack}, value={value})")
+        # value is a bitmask, bit 0 is MOSFET 1
+        self.state = [(value >> i) & 1 for i in range(8)]
+        print(f"[MOCK] set_all(stack={stack}, value={value:#04x})")
 
     def get_all(self, stack):
         result = sum((1 << i) if val else 0 for i, val in enumerate(self.state))
@@ -661,12 +658,12 @@ class MockLib8MosInd:
         return result
 
     def set_pwm(self, stack, mosfet, value):
-        self.pwm[mosfet] = value
+        self.pwm[mosfet - 1] = value
         print(f"[MOCK] set_pwm(stack={stack}, mosfet={mosfet}, value={value})")
 
     def get_pwm(self, stack, mosfet):
-        print(f"[MOCK] get_pwm(stack={stack}, mosfet={mosfet}) => {self.pwm[mosfet]}")
-        return self.pwm[mosfet]
+        print(f"[MOCK] get_pwm(stack={stack}, mosfet={mosfet}) => {self.pwm[mosfet - 1]}")
+        return self.pwm[mosfet - 1]
 
 class horizontalToggleSwitch(QCheckBox):
 
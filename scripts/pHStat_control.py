@@ -0,0 +1,254 @@
+# Controller modes as stored in settings.ini
+MODE_BANGBANG = "bangbang"
+MODE_PID = "pid"
+MODE_MODEL = "model"
+MODES = [MODE_BANGBANG, MODE_PID, MODE_MODEL]
+
+# All controllers work in the pumping direction: error is how far the pH still
+# has to move the way the pump pushes it (positive = pump needed) and slope is
+# how fast it already moves that way, in pH/s. They return pump seconds.
+
+class Trend:
+    """Exponentially smoothed pH slope in pH/s."""
+
+    def __init__(self, smoothing=0.3):
+        self.smoothing = smoothing
+        self.slope = 0.0
+        self.pH = None
+        self.time = None
+
+    def update(self, pH, now):
+        if self.pH is not None and now > self.time:
+            slope = (pH - self.pH) / (now - self.time)
+            self.slope += self.smoothing * (slope - self.slope)
+        self.pH = pH
+        self.time = now
+
+    def reset(self):
+        self.slope = 0.0
+        self.pH = None
+        self.time = None
+
+class BangBangController:
+    """The original behaviour: a fixed addtime pulse whenever the pH is on the wrong side."""
+
+    def __init__(self, addtime):
+        self.addtime = addtime
+
+    def update(self, error, slope, now):
+        pass
+
+    def dose(self, error, slope, now):
+        return self.addtime if error > 0 else 0.0
+
+    def dosed(self, seconds, error, slope, now):
+        pass
+
+    def reset(self):
+        pass
+
+    def state(self):
+        return {}
+
+    def restore(self, state):
+        pass
+
+class PIDController:
+    """PID on the pH error with conditional-integration anti-windup.
+
+    The derivative acts on the measured slope, so setpoint steps do not kick it.
+    """
+
+    def __init__(self, kp, ki, kd, min_dose, max_dose):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.min_dose = min_dose
+        self.max_dose = max_dose
+        self.integral = 0.0
+        self.last = None
+
+    def output(self, error, slope):
+        return self.kp * error + self.ki * self.integral - self.kd * slope
+
+    def update(self, error, slope, now):
+        dt = 0.0 if self.last is None else now - self.last
+        self.last = now
+        out = self.output(error, slope)
+        # Stop integrating while saturated in the direction the error pushes
+        if (out >= self.max_dose and error > 0) or (out <= 0 and error < 0):
+            return
+        self.integral += error * dt
+
+    def dose(self, error, slope, now):
+        out = min(self.output(error, slope), self.max_dose)
+        return out if out >= self.min_dose else 0.0
+
+    def dosed(self, seconds, error, slope, now):
+        pass
+
+    def reset(self):
+        self.integral = 0.0
+        self.last = None
+
+    def state(self):
+        return {"integral": self.integral}
+
+    def restore(self, state):
+        # The first update after a restore integrates nothing, so downtime does not count
+        self.integral = state.get("integral", 0.0)
+        self.last = None
+
+class ModelDoseController:
+    """Sizes each dose from the learned response of the solution to the pump.
+
+    gain is the pH change per pump second, which is set by the buffer
+    capacity. When the next decision is due, the error reached is compared
+    with where the slope before the dose would have taken it, and the
+    difference updates gain. The dose aims at the error predicted lookahead
+    seconds ahead, scaled down by aggressiveness to approach from one side.
+    """
+
+    def __init__(self, addtime, min_dose, max_dose, lookahead=5.0, aggressiveness=0.7, learning=0.3):
+        self.gain = None  # Unknown until the first dose settles
+        self.addtime = addtime
+        self.min_dose = min_dose
+        self.max_dose = max_dose
+        self.lookahead = lookahead
+        self.aggressiveness = aggressiveness
+        self.learning = learning
+        self.pending = None  # (seconds, error, slope, time) of the last dose
+
+    def update(self, error, slope, now):
+        pass
+
+    def learn(self, error, now):
+        seconds, start_error, start_slope, start = self.pending
+        self.pending = None
+        expected = start_error - start_slope * (now - start)
+        response = (expected - error) / seconds
+        if response <= 0:
+            return  # Swamped by noise or drift, learn nothing
+        if self.gain is None:
+            self.gain = response
+        else:
+            self.gain += self.learning * (response - self.gain)
+
+    def dose(self, error, slope, now):
+        if self.pending is not None:
+            self.learn(error, now)
+        predicted = error - slope * self.lookahead
+        if predicted <= 0:
+            return 0.0
+        if not self.gain:
+            # Nothing learned yet, probe with the calibrated pulse
+            return self.addtime
+        seconds = min(self.aggressiveness * predicted / self.gain, self.max_dose)
+        return seconds if seconds >= self.min_dose else 0.0
+
+    def dosed(self, seconds, error, slope, now):
+        self.pending = (seconds, error, slope, now)
+
+    def reset(self):
+        self.pending = None
+
+    def state(self):
+        return {"gain": self.gain}
+
+    def restore(self, state):
+        self.gain = state.get("gain")
+        self.pending = None
+
+def make_controller(mode, addtime, kp, ki, kd, min_dose, max_dose):
+    if mode == MODE_PID:
+        return PIDController(kp, ki, kd, min_dose, max_dose)
+    if mode == MODE_MODEL:
+        return ModelDoseController(addtime, min_dose, max_dose)
+    return BangBangController(addtime)
+
+class ResponseEstimator:
+    """Learns how long the pH takes to show a dose, to set the cooldown from.
+
+    Every dose starts a track at the end of its pulse. The deviation of the
+    samples from where the pH was heading before the dose is followed until
+    it stops growing: the time to 10% of the peak is the dead time (mixing
+    plus transport) and the time from there to 63% the time constant of the
+    probe and mixing. Both are averaged over doses and the cooldown becomes
+    delay + settle * tau, kept within min_cooldown and max_cooldown. A
+    response that was still growing when the track ended only stretches the
+    cooldown while there is no estimate yet, so the first doses are watched
+    for longer; once there is one, such tracks are left out. The response
+    counts as still growing when it first came within peak_tolerance of its
+    maximum in the last two samples, so noise on a plateau does not.
+    """
+
+    def __init__(self, cooldown, min_cooldown, max_cooldown, settle=3.0, learning=0.3, min_response=0.01):
+        self.min_cooldown = min_cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = min(max(cooldown, min_cooldown), max_cooldown)
+        self.settle = settle
+        self.learning = learning
+        self.min_response = min_response  # pH, smaller responses are noise
+        self.peak_tolerance = 0.05        # Fraction of the peak
+        self.delay = None
+        self.tau = None
+        self.track = None  # [start, pH, slope, direction, [(t, deviation), ...]]
+
+    def state(self):
+        return {"delay": self.delay, "tau": self.tau, "cooldown": self.cooldown}
+
+    def restore(self, state):
+        self.delay = state.get("delay")
+        self.tau = state.get("tau")
+        self.cooldown = min(max(state.get("cooldown", self.cooldown), self.min_cooldown), self.max_cooldown)
+        self.track = None
+
+    def start(self, start, pH, slope, direction):
+        """A dose ends at *start*; returns True when the previous track changed the estimate."""
+        updated = self.finish()
+        self.track = [start, pH, slope, direction, []]
+        return updated
+
+    def sample(self, pH, now):
+        """Add a sample; returns True when it completed a track and changed the estimate."""
+        if self.track is None:
+            return False
+        start, pH0, slope0, direction, points = self.track
+        t = now - start
+        if t < 0:
+            return False
+        points.append((t, direction * (pH - pH0 - slope0 * t)))
+        if t > self.max_cooldown:
+            return self.finish()
+        return False
+
+    def finish(self):
+        if self.track is None:
+            return False
+        points = self.track[4]
+        self.track = None
+        if len(points) < 3:
+            return False
+        peak = max(d for t, d in points)
+        if peak < self.min_response:
+            return False
+        peak_index = next(i for i, (t, d) in enumerate(points) if d >= (1 - self.peak_tolerance) * peak)
+        if peak_index >= len(points) - 2:
+            if self.delay is not None:
+                return False  # Cut short by the next dose, the estimate is better without it
+            # Still rising when the next dose came, give it more time
+            cooldown = min(max(self.cooldown, 1.5 * points[-1][0]), self.max_cooldown)
+            changed = cooldown != self.cooldown
+            self.cooldown = cooldown
+            return changed
+
+        delay = next(t for t, d in points if d >= 0.1 * peak)
+        t63 = next(t for t, d in points if d >= 0.63 * peak)
+        tau = max(t63 - delay, 0.0)
+        if self.delay is None:
+            self.delay, self.tau = delay, tau
+        else:
+            self.delay += self.learning * (delay - self.delay)
+            self.tau += self.learning * (tau - self.tau)
+        self.cooldown = min(max(self.delay + self.settle * self.tau, self.min_cooldown), self.max_cooldown)
+        return True
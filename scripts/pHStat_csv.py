@@ -4,20 +4,22 @@ import os.path
 from pathlib import Path
 import time
 import csv
-import locale
+import glob
+import io
+import queue
+import struct
+import threading
+import warnings
 import numpy as np
-# Set the locale to Dutch (Netherlands)
-locale.setlocale(locale.LC_ALL, 'nl_NL.utf8')  # On Windows, try 'Dutch_Netherlands' or 'nl_NL'
+from PyQt5.QtCore import QObject
 from scripts.pHStat_classes import PowerLogger
+from scripts.pHStat_store import SessionStore, read_store, store_started
+from scripts.pHStat_journal import JournaledFile
 
 def create_csv(self, data, plots, header):
     """
     This function creates a new CSV file to log data with appropriate headers.
     """
-    try:
-        locale.setlocale(locale.LC_ALL, 'nl_NL.utf8')  # Adjust for your locale if necessary
-    except locale.Error:
-        print("Locale setting failed. Proceeding with default locale.")
 
     # Get the current time
     now = datetime.now()
@@ -28,6 +30,14 @@ def create_csv(self, data, plots, header):
     if hasattr(self, 'ppsWorker'):      
         self.logger = PowerLogger(log_dir=script_dir)
         
+    if self.binaryLog:
+        create_store(self, now, script_dir, data, header)
+        return
+
+    if self.wideLog:
+        create_wide_csv(self, now, script_dir, data, header)
+        return
+
     for i, labels in enumerate(plots):
         if self.Log_file[i]:
             return
@@ -67,7 +77,7 @@ def create_csv(self, data, plots, header):
                 
                 # Write the header
                 dict_writer.writeheader()
-                number = locale.format_string("%.3f", data[i], grouping=True)
+                number = format_number(data[i], 3, grouping=True)
 
                 initial_row = {
                 'Reaction time (s)': 0,  # We start at 0
@@ -75,81 +85,341 @@ def create_csv(self, data, plots, header):
                 }
                 dict_writer.writerow(initial_row)
 
-def log_csv(self, data, index, label):
-    locale.setlocale(locale.LC_ALL, 'nl_NL.utf8')  # On Windows, try 'Dutch_Netherlands' or 'nl_NL'
-    
-    #if index == 0: 
-    #    number = locale.format_string("%.1f", data, grouping=True)
-    #else: 
-    if isinstance(data, (int, float)):
-        number = locale.format_string("%.3f", data, grouping=True)
-    else:
-        number = data
-    #now = datetime.now()
-    #time_count = time.time() - self.Log_date[index]
-    time_count = self.logging_timer.elapsed()
+# Columns of the pump event stream next to a wide session log
+EVENT_HEADER = ['Channel', 'Commanded (s)', 'Measured (s)', 'Volume (ml)', 'Total (ml)', 'PWM']
 
-    #current_time = now.strftime("%H:%M:%S.%f")[:-3] 
-    abs_file_path = self.Log_file[index]
-    #time_count_formatted = locale.format_string('%.0f', round(time_count,0)) 
-    time_count_formatted = locale.format_string('%.1f', time_count)
-
-    if os.path.exists(abs_file_path):
-        append_csv(abs_file_path, time_count_formatted, number, label)
-
-def append_csv(abs_file_path, time_count, data, label):
-    locale.setlocale(locale.LC_ALL, 'nl_NL.utf8')  # On Windows, try 'Dutch_Netherlands' or 'nl_NL'
-
-    with open(abs_file_path, 'a', newline='') as csvfile:
-        fieldnames = ['Reaction time (s)', label]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=';')
-        writer.writerow({
-            #'Time': current_time,
-            'Reaction time (s)': time_count,
-            label : data
-            })
-
-def read_log_data(self, index):
-    locale.setlocale(locale.LC_ALL, 'nl_NL.utf8')  # On Windows, try 'Dutch_Netherlands' or 'nl_NL'
-    
+def create_wide_csv(self, now, script_dir, data, header):
+    """
+    One Session log with a column per channel, Log_file[1..5] all point at it.
+    Pump pulses go to a separate Pump events file in Log_file[0].
+    """
+    if self.Log_file[1]:
+        return
+    stamp = now.strftime('%d%m%Y_%H%M%S')
+    session_path = os.path.join(script_dir, f"Session_log_{stamp}.csv")
+    events_path = os.path.join(script_dir, f"Pump_events_{stamp}.csv")
+    for i in range(len(self.Log_file)):
+        if not self.Log_date[i]:
+            self.Log_date[i] = time.time()
+    self.Log_file = [events_path] + [session_path] * (len(self.Log_file) - 1)
+
+    for path, labels, fieldnames, row in (
+            (session_path, "Session", header, [format_number(value, 3, grouping=True) for value in data]),
+            (events_path, "Pump events", EVENT_HEADER, None)):
+        with open(path, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile, delimiter=';')
+            writer.writerow([labels])
+            writer.writerow(["Date " + now.strftime("%d-%m-%Y")])
+            writer.writerow(["Start Time " + now.strftime("%H:%M:%S")])
+            writer.writerow(['Reaction time (s)'] + list(fieldnames))
+            if row is not None:
+                writer.writerow([0] + row)
+
+def create_store(self, now, script_dir, data, header):
+    """
+    Open the binary SessionStore of the session, a new one if there is none yet.
+    Log_file holds its base path for every channel.
+    """
+    new = not self.Log_file[0]
+    if new:
+        self.Log_file = [os.path.join(script_dir, f"Session_{now.strftime('%d%m%Y_%H%M%S')}")] * len(self.Log_file)
+        for i in range(len(self.Log_date)):
+            self.Log_date[i] = time.time()
+    self.sessionStore = SessionStore(self.Log_file[0], header)
+    if new:
+        self.sessionStore.append(0.0, data)
+
+def export_store_csv(base, folder, plots, header):
+    """
+    Write the familiar per channel CSV logs of a SessionStore into *folder*,
+    e.g. when copying to USB. Rows without a value for a channel are left out.
+    """
+    table = read_store(base)
+    if not table:
+        return []
+    started = datetime.fromtimestamp(store_started(base))
+    times = table["Reaction time"]
+    paths = []
+    for labels, fieldname, values in zip(plots, header, list(table.values())[1:]):
+        path = os.path.join(folder, f"{labels}_log_{started.strftime('%d%m%Y_%H%M%S')}.csv")
+        logged = ~np.isnan(values)
+        with open(path, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile, delimiter=';')
+            writer.writerow([labels])
+            writer.writerow(["Date " + started.strftime("%d-%m-%Y")])
+            writer.writerow(["Start Time " + started.strftime("%H:%M:%S")])
+            writer.writerow(['Reaction time (s)', fieldname])
+            writer.writerows([format_number(t, 1), format_number(value, 3, grouping=True)]
+                             for t, value in zip(times[logged], values[logged]))
+        paths.append(path)
+    return paths
+
+def log_csv(self, data, index, label):
+    # Rows are written by the CSVWriter thread, which keeps the session files open
     abs_file_path = self.Log_file[index]
+    if abs_file_path:
+        self.csvWriter.write(abs_file_path, self.logging_timer.elapsed(), data)
 
-    if not abs_file_path:
-        return [], []
+def log_wide_csv(self, values):
+    # One row of the Session log, None leaves the cell of a channel empty
+    if self.Log_file[1]:
+        self.csvWriter.write(self.Log_file[1], self.logging_timer.elapsed(), *values)
 
-    filedata = csv.reader(open(abs_file_path, 'rt'), delimiter=";")
-    #time, cond = [], []
-    # Skip the three header rows
-    for _ in range(3):
-        next(filedata)
-    
-    next(filedata)
+def log_event(self, pulse, volume, total):
+    # One pump pulse (or PWM segment) in the Pump events file
+    if self.Log_file[0]:
+        self.csvWriter.write(self.Log_file[0], self.logging_timer.elapsed(), pulse.channel,
+                             pulse.commanded, pulse.measured, volume, total, int(pulse.pwm))
 
-    reaction_times = []
-    data_values = []
-        
-    for row in filedata:
-        row = [cell for cell in row if cell]
-
-        # Convert the second and third elements to float
-        # Assuming the "Reaction time" is in the second column and the data is in the third
-        if len(row) >= 2:  # Make sure the row has enough elements
-            reaction_str, data_str = row[:2]
-            reaction_time = convert_to_float(reaction_str)
-            data = convert_to_float(data_str)
-                
-            reaction_times.append(reaction_time)
-            data_values.append(data)    
-    return reaction_times, data_values
+# Dutch notation swaps the decimal point and the thousands separator
+_DUTCH = str.maketrans(",.", ".,")
+
+def format_number(value, decimals, grouping=False):
+    """Format like locale.format_string in nl_NL, without the process-global setlocale."""
+    text = f"{value:,.{decimals}f}" if grouping else f"{value:.{decimals}f}"
+    return text.translate(_DUTCH)
+
+class CSVWriter(QObject):
+    """Appends log rows from its own thread to the session files, which it keeps open.
+
+    write() only queues the row. The rows of each file are committed as one
+    checksummed chunk (see JournaledFile) every flush_interval seconds
+    (0 = after every row), with an os.fsync per commit when fsync is set.
+    flush(wait=True) commits everything queued so far, e.g. before the
+    session folder is copied.
+    """
+
+    def __init__(self, flush_interval=5.0, fsync=True):
+        super().__init__()
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.rows = queue.Queue()
+        self.files = {}     # path -> JournaledFile
+        self.dirty = set()  # paths written since the last commit
+        self.line = io.StringIO()
+        self.writer = csv.writer(self.line, delimiter=';')
+        self.is_running = True
+
+    def write(self, path, elapsed, *values):
+        self.rows.put(("row", path, elapsed, values))
+
+    def flush(self, wait=False):
+        done = threading.Event()
+        self.rows.put(("flush", done))
+        if wait:
+            done.wait(5)
+
+    def close_all(self):
+        # Closes the files of the session, e.g. after a reset
+        self.rows.put(("close", None))
+
+    def run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while self.is_running:
+            timeout = max(next_flush - time.monotonic(), 0.0) if self.dirty else 0.5
+            try:
+                item = self.rows.get(timeout=min(timeout, 0.5))
+            except queue.Empty:
+                item = None
+            if item is not None:
+                self.handle(item)
+            if self.dirty and time.monotonic() >= next_flush:
+                self.sync()
+            if not self.dirty:
+                next_flush = time.monotonic() + self.flush_interval
+        # Rows queued before stop() still go to disk
+        while True:
+            try:
+                self.handle(self.rows.get_nowait())
+            except queue.Empty:
+                break
+        self.close_files()
+
+    def handle(self, item):
+        kind = item[0]
+        if kind == "row":
+            self.write_row(*item[1:])
+        elif kind == "flush":
+            self.sync()
+            item[1].set()
+        elif kind == "close":
+            self.close_files()
 
-def convert_to_float(s):
+    def write_row(self, path, elapsed, values):
+        journaled = self.files.get(path)
+        if journaled is None:
+            if not os.path.exists(path):
+                return
+            try:
+                journaled = self.files[path] = JournaledFile(path)
+            except OSError as e:
+                print(f"Error opening {os.path.basename(path)}: {e}")
+                return
+        cells = [format_number(elapsed, 1)]
+        for value in values:
+            if value is None:
+                value = ''
+            elif isinstance(value, float):
+                value = format_number(value, 3, grouping=True)
+            cells.append(value)
+        self.line.seek(0)
+        self.line.truncate()
+        self.writer.writerow(cells)
+        journaled.append(self.line.getvalue().encode('utf-8'))
+        self.dirty.add(path)
+
+    def sync(self):
+        for path in self.dirty:
+            try:
+                self.files[path].commit(self.fsync)
+            except OSError as e:
+                print(f"Error writing {os.path.basename(path)}: {e}")
+        self.dirty.clear()
+
+    def close_files(self):
+        self.sync()
+        for journaled in self.files.values():
+            try:
+                journaled.close()
+            except OSError as e:
+                print(f"Error closing {os.path.basename(journaled.path)}: {e}")
+        self.files = {}
+
+    def stop(self):
+        self.is_running = False
+
+# Parsed rows of a log, next to it as <log>.cache.npy, mapped instead of read when loading
+LOG_CACHE_SUFFIX = ".cache.npy"
+# Bytes before the end of the cached rows that must still match, the logs are only appended to
+LOG_CACHE_CHECK = 64
+# After the array: end of the cached rows in the log, length of the check and the check itself
+LOG_CACHE_TRAILER = struct.Struct(f"<QB{LOG_CACHE_CHECK}s")
+
+def parse_log_body(body, columns):
+    """Parse complete log rows into an (n, columns) float array, bad or empty cells are NaN."""
+    if not body.strip():
+        return np.empty((0, columns))
+    # Dutch notation: drop the thousands dots, then the decimal comma becomes a point
+    body = body.replace(b'.', b'').replace(b',', b'.').replace(b'N/A', b'nan')
+    # Empty cells (a channel without a value in a wide log) become nan
+    body = body.replace(b';;', b';nan;').replace(b';;', b';nan;')
+    body = body.replace(b';\r', b';nan\r').replace(b';\n', b';nan\n').replace(b'\n;', b'\nnan;')
+    if body.startswith(b';'):
+        body = b'nan' + body
     try:
-        return float(s.replace(',', '.'))
+        table = np.loadtxt(io.BytesIO(body), delimiter=';', ndmin=2)
     except ValueError:
-        print(f"Error converting {s} to float.")
-        
-        #return float(s)
+        # Anything else that is not a number, genfromtxt is slower but makes it NaN
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            table = np.genfromtxt(io.BytesIO(body), delimiter=';', invalid_raise=False)
+    return table.reshape(-1, columns)
+
+def read_log_cache(path, columns):
+    """Return (table, end, check) from the cache of *path*, None if there is no usable one."""
+    cache_path = path + LOG_CACHE_SUFFIX
+    try:
+        with open(cache_path, 'rb') as f:
+            f.seek(-LOG_CACHE_TRAILER.size, os.SEEK_END)
+            end, length, check = LOG_CACHE_TRAILER.unpack(f.read(LOG_CACHE_TRAILER.size))
+        # Copy on write, the caller may change the rows without touching the cache
+        table = np.load(cache_path, mmap_mode='c')
+    except (OSError, ValueError, struct.error):
+        return None
+    if table.ndim != 2 or table.shape[1] != columns:
         return None
+    return table, end, check[:length]
+
+def write_log_cache(path, table, end, check):
+    tmp_path = path + LOG_CACHE_SUFFIX + ".tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.save(f, table)
+            f.write(LOG_CACHE_TRAILER.pack(end, len(check), check))
+        os.replace(tmp_path, path + LOG_CACHE_SUFFIX)
+    except OSError as e:
+        # E.g. a read-only stick, the log still loads, just not faster next time
+        print(f"Error caching {os.path.basename(path)}: {e}")
+
+def load_log(path):
+    """
+    Load a whole log file in one vectorized pass.
+    Returns (pre_header, header, table) with table an (n, columns) float array,
+    malformed or empty cells are NaN and a torn last row is dropped.
+    The parsed rows are cached next to the log, so loading it again only
+    parses the rows appended since.
+    """
+    with open(path, 'rb') as f:
+        lines = [f.readline() for _ in range(4)]
+        if not lines[2].endswith(b'\n') or not lines[3]:
+            raise ValueError(f"{os.path.basename(path)} has no header")
+        pre_header = [line.decode('utf-8', errors='replace').strip().strip('"') for line in lines[:3]]
+        header = next(csv.reader([lines[3].decode('utf-8', errors='replace').strip()], delimiter=';'))
+        body_start = f.tell()
+
+        table, end = None, body_start
+        cached = read_log_cache(path, len(header))
+        if cached is not None:
+            cached_table, cached_end, check = cached
+            # Only trust it when the bytes before its end are still the same
+            if body_start <= cached_end <= os.fstat(f.fileno()).st_size:
+                f.seek(cached_end - len(check))
+                if f.read(len(check)) == check:
+                    table, end = cached_table, cached_end
+        # Read from a little before the cached rows on, for the check of the next load
+        lead = max(end - LOG_CACHE_CHECK, body_start)
+        f.seek(lead)
+        data = f.read()
+    body = data[end - lead:]
+    # A torn last row has no line end yet
+    body = body[:body.rfind(b'\n') + 1]
+    if table is not None and not body:
+        return pre_header, header, table
+    rows = parse_log_body(body, len(header))
+    table = rows if table is None else np.concatenate((table, rows))
+    end += len(body)
+    check = data[max(end - LOG_CACHE_CHECK, body_start) - lead:end - lead]
+    write_log_cache(path, table, end, check)
+    return pre_header, header, table
+
+def load_session(folder, plots, header):
+    """
+    Load every channel of the session in *folder* at once, whichever way it was logged.
+    Returns {label: (reaction times, values)} for the labels in *plots*, rows
+    without a value for a channel are left out.
+    """
+    def logged(times, values):
+        keep = ~np.isnan(values)
+        return times[keep], values[keep]
+
+    def latest(pattern):
+        paths = sorted(glob.glob(os.path.join(glob.escape(folder), pattern)))
+        return paths[-1] if paths else None
+
+    channels = {}
+    store = latest("Session_*_0000.phs")
+    session = latest("Session_log_*.csv")
+    if store:
+        table = read_store(store[:-len("_0000.phs")])
+        times = table["Reaction time"]
+        for labels, values in zip(plots, list(table.values())[1:]):
+            channels[labels] = logged(times, values)
+    elif session:
+        _, columns, table = load_log(session)
+        for labels, fieldname in zip(plots[1:], header[1:]):
+            if fieldname in columns:
+                channels[labels] = logged(table[:, 0], table[:, columns.index(fieldname)])
+        events = latest("Pump_events_*.csv")
+        if events:
+            _, columns, table = load_log(events)
+            channels[plots[0]] = logged(table[:, 0], table[:, columns.index('Total (ml)')])
+    else:
+        for labels in plots:
+            path = latest(f"{labels}_log_*.csv")
+            if path:
+                _, _, table = load_log(path)
+                channels[labels] = logged(table[:, 0], table[:, 1])
+    return channels
 
 def get_correct_path(sub_path):
     sudo_user = os.environ.get('SUDO_USER')
@@ -193,14 +463,15 @@ def create_folder():
     return folder_path
 
 def scale_time_data(self, time, data):
-        if not time:
+        if len(time) == 0:
             return [0], [0], 'sec', 1
     
-        if max(time) > 3600:
+        longest = np.max(time)
+        if longest > 3600:
             time = np.array(time) / 3600
             time_unit = 'hr'  # Use 'hr' for hours
             scale = 3
-        elif max(time) > 60:
+        elif longest > 60:
             time = np.array(time) / 60
             time_unit = 'min'  # Use 'min' for minutes
             scale = 2
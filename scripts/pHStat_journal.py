@@ -0,0 +1,128 @@
+import glob
+import json
+import os
+import struct
+import zlib
+
+JOURNAL_SUFFIX = ".journal"
+# One commit: end offset of the chunk in the log file, its length and CRC32
+JOURNAL_RECORD = struct.Struct("<QII")
+# Written when a session starts and removed by a reset, so startup knows it was not finished
+SESSION_FILE = "session.json"
+
+class JournaledFile:
+    """A text log appended to in group commits, with a checksum per commit.
+
+    append() only collects the bytes. commit() writes them in one go,
+    optionally fsyncs, and then adds a JOURNAL_RECORD for the chunk to
+    <path>.journal. After a power loss recover() keeps the log up to the
+    last chunk whose checksum still matches and drops everything after it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "ab")
+        self.journal = open(path + JOURNAL_SUFFIX, "ab")
+        self.pending = []
+
+    def append(self, data):
+        self.pending.append(data)
+
+    def commit(self, fsync=False):
+        if not self.pending:
+            return
+        chunk = b"".join(self.pending)
+        self.pending = []
+        self.file.write(chunk)
+        self.file.flush()
+        if fsync:
+            os.fsync(self.file.fileno())
+        # The record goes after the data, a record without its data fails the checksum
+        self.journal.write(JOURNAL_RECORD.pack(self.file.tell(), len(chunk), zlib.crc32(chunk)))
+        self.journal.flush()
+        if fsync:
+            os.fsync(self.journal.fileno())
+
+    def close(self, fsync=False):
+        self.commit(fsync)
+        self.file.close()
+        self.journal.close()
+
+def recover(path):
+    """Truncate a torn tail off a log file, returns the number of bytes dropped.
+
+    With a journal the file is cut after the last chunk that passes its
+    checksum, without one (e.g. the power log) after the last full line.
+    """
+    size = os.path.getsize(path)
+    journal_path = path + JOURNAL_SUFFIX
+    if os.path.exists(journal_path):
+        with open(journal_path, "rb") as f:
+            raw = f.read()
+        records = [JOURNAL_RECORD.unpack_from(raw, i)
+                   for i in range(0, len(raw) - JOURNAL_RECORD.size + 1, JOURNAL_RECORD.size)]
+        keep = None
+        with open(path, "rb") as f:
+            for n in range(len(records) - 1, -1, -1):
+                end, length, crc = records[n]
+                if end > size:
+                    continue
+                f.seek(end - length)
+                if zlib.crc32(f.read(length)) == crc:
+                    keep = n + 1
+                    break
+        if keep is None:
+            # Nothing committed survived, keep what was there before the first chunk
+            keep = 0
+            end = records[0][0] - records[0][1] if records else size
+        else:
+            end = records[keep - 1][0]
+        os.truncate(journal_path, keep * JOURNAL_RECORD.size)
+    else:
+        with open(path, "rb") as f:
+            end = f.read().rfind(b"\n") + 1
+    if end < size:
+        os.truncate(path, end)
+    return size - end
+
+def recover_session(folder):
+    """Recover all text logs in a session folder, returns {file name: bytes dropped} for the torn ones."""
+    dropped = {}
+    for path in sorted(glob.glob(os.path.join(glob.escape(folder), "*.csv")) +
+                       glob.glob(os.path.join(glob.escape(folder), "*.txt"))):
+        try:
+            lost = recover(path)
+        except OSError as e:
+            print(f"Error recovering {os.path.basename(path)}: {e}")
+            continue
+        if lost:
+            dropped[os.path.basename(path)] = lost
+    return dropped
+
+def write_session(folder, state):
+    """Store the state needed to continue the session in <folder>/session.json, atomically."""
+    path = os.path.join(folder, SESSION_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def read_session(folder):
+    with open(os.path.join(folder, SESSION_FILE)) as f:
+        return json.load(f)
+
+def close_session(folder):
+    # The session is finished, startup no longer offers to continue it
+    try:
+        os.remove(os.path.join(folder, SESSION_FILE))
+    except FileNotFoundError:
+        pass
+
+def latest_session(data_dir):
+    """Folder of the most recent session that was not finished, None if there is none."""
+    paths = glob.glob(os.path.join(glob.escape(str(data_dir)), "*", "*", SESSION_FILE))
+    if not paths:
+        return None
+    return os.path.dirname(max(paths, key=os.path.getmtime))
@@ -0,0 +1,153 @@
+import os
+import struct
+import time
+
+import numpy as np
+
+LEDGER_MAGIC = b"PHDL"
+LEDGER_VERSION = 1
+# magic, version, time.time() and time.monotonic() when the ledger was created
+LEDGER_HEADER = struct.Struct("<4sHdd")
+# One pulse: monotonic start, measured s, commanded s, channel, volume ml
+LEDGER_RECORD = struct.Struct("<dffBf")
+# Set in the channel byte for a segment of continuous PWM dosing
+LEDGER_PWM = 0x80
+LEDGER_DTYPE = np.dtype([
+    ("start", "<f8"),
+    ("measured", "<f4"),
+    ("commanded", "<f4"),
+    ("channel", "u1"),
+    ("volume", "<f4"),
+])
+
+class PumpCurve:
+    """Volume delivered by one pulse as a function of its duration.
+
+    Fitted through calibration points (seconds, ml): one point gives the old
+    linear ml/addtime flow, two a line with an offset for the spin-up and
+    dead volume of the pump, three or more a least squares parabola.
+    """
+
+    def __init__(self, points):
+        points = sorted(points)
+        if not points:
+            raise ValueError("A pump curve needs at least one calibration point")
+        seconds = np.array([p[0] for p in points], dtype=float)
+        ml = np.array([p[1] for p in points], dtype=float)
+        if len(points) == 1:
+            self.coefficients = np.array([ml[0] / seconds[0], 0.0])
+        else:
+            self.coefficients = np.polyfit(seconds, ml, min(len(points) - 1, 2))
+        self.points = points
+        # Running flow, taken from the longest calibrated pulse where spin-up matters least
+        self.flow = float(self.volume(seconds[-1])) / seconds[-1]
+
+    def volume(self, seconds):
+        """ml for a pulse of *seconds*, works on scalars and arrays."""
+        return np.maximum(np.polyval(self.coefficients, seconds), 0.0)
+
+    def continuous(self, seconds):
+        """ml for *seconds* of full output while the pump keeps running (PWM dosing)."""
+        return self.flow * np.asarray(seconds)
+
+class DoseLedger:
+    """Append-only binary record of every pump pulse of a run.
+
+    Each pulse is one fixed-size LEDGER_RECORD after a LEDGER_HEADER, so
+    read_ledger() can map the whole file into a NumPy structured array.
+    Totals per channel are kept up to date on every append and can be
+    recomputed from the measured durations when the calibration changes.
+    """
+
+    def __init__(self, path, curves):
+        self.path = path
+        self.curves = curves  # channel -> PumpCurve
+        self.totals = {}      # channel -> ml
+        self.count = 0
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new:
+            # Drop a torn last record so new ones stay aligned
+            records = (os.path.getsize(path) - LEDGER_HEADER.size) // LEDGER_RECORD.size
+            os.truncate(path, LEDGER_HEADER.size + max(records, 0) * LEDGER_RECORD.size)
+        self.file = open(path, "ab")
+        if new:
+            self.file.write(LEDGER_HEADER.pack(LEDGER_MAGIC, LEDGER_VERSION, time.time(), time.monotonic()))
+            self.file.flush()
+        else:
+            # Continuing a run, pick up what was dosed before
+            self.recompute(curves)
+
+    def volume(self, channel, seconds, pwm=False):
+        if pwm:
+            return float(self.curves[channel].continuous(seconds))
+        return float(self.curves[channel].volume(seconds))
+
+    def append(self, pulse):
+        """Record a Pulse and return the volume it delivered in ml."""
+        volume = self.volume(pulse.channel, pulse.measured, pulse.pwm)
+        flags = LEDGER_PWM if pulse.pwm else 0
+        self.file.write(LEDGER_RECORD.pack(pulse.start, pulse.measured, pulse.commanded, pulse.channel | flags, volume))
+        self.file.flush()
+        self.totals[pulse.channel] = self.totals.get(pulse.channel, 0.0) + volume
+        self.count += 1
+        return volume
+
+    def total(self, channel=None):
+        if channel is None:
+            return sum(self.totals.values())
+        return self.totals.get(channel, 0.0)
+
+    def recompute(self, curves):
+        """Switch to new calibration curves and recompute the totals of the run so far."""
+        self.curves = curves
+        self.file.flush()
+        records = read_ledger(self.path)
+        self.totals = {}
+        # ~LEDGER_PWM is a negative Python int, which NumPy 2 refuses to mix with uint8
+        channels = records["channel"] & (~LEDGER_PWM & 0xFF)
+        pwm = (records["channel"] & LEDGER_PWM) != 0
+        for channel in np.unique(channels):
+            curve = curves[int(channel)]
+            mine = channels == channel
+            total = np.sum(curve.volume(records["measured"][mine & ~pwm]))
+            total += np.sum(curve.continuous(records["measured"][mine & pwm]))
+            self.totals[int(channel)] = float(total)
+        self.count = len(records)
+        return self.totals
+
+    def close(self):
+        self.file.close()
+
+def read_ledger(path):
+    """Return all pulses in a ledger file as a structured array of LEDGER_DTYPE."""
+    with open(path, "rb") as f:
+        header = f.read(LEDGER_HEADER.size)
+    magic, version, _, _ = LEDGER_HEADER.unpack(header)
+    if magic != LEDGER_MAGIC or version != LEDGER_VERSION:
+        raise ValueError(f"{path} is not a version {LEDGER_VERSION} dose ledger")
+    size = os.path.getsize(path) - LEDGER_HEADER.size
+    # A torn last record from a crash is ignored
+    count = size // LEDGER_RECORD.size
+    return np.fromfile(path, dtype=LEDGER_DTYPE, count=count, offset=LEDGER_HEADER.size)
+
+if __name__ == '__main__':
+    # Round trip: write pulses and a PWM segment, reopen the ledger and compare the totals
+    import tempfile
+    from collections import namedtuple
+
+    Pulse = namedtuple("Pulse", "channel commanded measured start test pwm")
+    curves = {1: PumpCurve([(1.0, 0.5), (5.0, 2.6)]), 2: PumpCurve([(2.0, 1.0)])}
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "ledger.bin")
+        ledger = DoseLedger(path, curves)
+        ledger.append(Pulse(1, 1.0, 1.02, 10.0, False, False))
+        ledger.append(Pulse(2, 0.5, 0.49, 20.0, False, False))
+        ledger.append(Pulse(1, 5.0, 5.0, 30.0, False, True))
+        written = dict(ledger.totals)
+        ledger.close()
+        reopened = DoseLedger(path, curves)
+        assert reopened.count == 3, reopened.count
+        for channel, total in written.items():
+            assert abs(reopened.total(channel) - total) < 1e-5, (channel, reopened.total(channel), total)
+        reopened.close()
+    print("Ledger round trip OK:", {channel: round(total, 4) for channel, total in written.items()})
@@ -0,0 +1,190 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+import json
+import threading
+import time
+from datetime import datetime
+
+# keepSelector index for the names used in recipes
+SELECT_NAMES = {"above": 0, "below": 1, "at": 2}
+
+def parse_duration(value):
+    """Seconds from a number of seconds or an "h:mm" / "h:mm:ss" string."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    parts = [float(part) for part in str(value).split(":")]
+    if len(parts) == 1:
+        return parts[0]
+    if len(parts) == 2:
+        return parts[0] * 3600 + parts[1] * 60
+    if len(parts) == 3:
+        return parts[0] * 3600 + parts[1] * 60 + parts[2]
+    raise ValueError(f"Cannot read {value!r} as a duration")
+
+def load_recipe(path):
+    """Read and check a recipe file.
+
+    A recipe is a JSON object with an optional "name" and a list of
+    "steps". Every step runs either "at" a time after the start of the run
+    (seconds or "h:mm[:ss]") or "when_coulombs" reaches a charge, and does
+    one or more of:
+        "setpoint": 9.0
+        "ramp": {"to": 8.0, "over": "0:30"}
+        "select": "above" | "below" | "at"
+        "pps": {"voltage": 5.0, "current": 2.0, "mode": "CV", "output": true}
+        "stop": true
+        "note": "free text for the journal"
+    e.g. hold pH 9 for 2 h, ramp to 8 over 30 min, 5 V at 3 h, stop at 500 C:
+        {"steps": [{"at": 0, "setpoint": 9.0},
+                   {"at": "2:00", "ramp": {"to": 8.0, "over": "0:30"}},
+                   {"at": "3:00", "pps": {"voltage": 5.0, "output": true}},
+                   {"when_coulombs": 500, "stop": true}]}
+    """
+    with open(path) as f:
+        recipe = json.load(f)
+    steps = []
+    for number, step in enumerate(recipe.get("steps", []), start=1):
+        step = dict(step)
+        if "at" in step:
+            step["at"] = parse_duration(step["at"])
+        elif "when_coulombs" in step:
+            step["when_coulombs"] = float(step["when_coulombs"])
+        else:
+            raise ValueError(f"Step {number} has neither \"at\" nor \"when_coulombs\"")
+        if "ramp" in step:
+            step["ramp"] = {"to": float(step["ramp"]["to"]), "over": parse_duration(step["ramp"]["over"])}
+        if "setpoint" in step:
+            step["setpoint"] = float(step["setpoint"])
+        if "select" in step:
+            select = step["select"]
+            step["select"] = SELECT_NAMES[select.lower()] if isinstance(select, str) else int(select)
+        step["number"] = number
+        steps.append(step)
+    if not steps:
+        raise ValueError("The recipe has no steps")
+    return {"name": recipe.get("name", ""), "steps": steps, "path": path}
+
+def describe(step):
+    what = []
+    if "setpoint" in step:
+        what.append(f"setpoint pH {step['setpoint']:.2f}")
+    if "ramp" in step:
+        what.append(f"ramp to pH {step['ramp']['to']:.2f} over {step['ramp']['over']:.0f} s")
+    if "select" in step:
+        what.append("keep " + {0: "above", 1: "below", 2: "at"}.get(step["select"], str(step["select"])))
+    if "pps" in step:
+        what.append("PPS " + ", ".join(f"{key} {value}" for key, value in step["pps"].items()))
+    if step.get("stop"):
+        what.append("stop")
+    if "note" in step:
+        what.append(step["note"])
+    return "; ".join(what)
+
+class RecipeRunner(QObject):
+    """Runs a loaded recipe on its own thread, timed against time.monotonic().
+
+    Steps are due at start + "at" or once update_coulombs() reports the
+    charge of a "when_coulombs" step, and are carried out through the signals
+    below by the GUI. A ramp sends an interpolated setpoint every
+    ramp_interval seconds. Every step is appended to the journal file with
+    its planned and actual time, only ever from the runner thread.
+
+    A start in the past (a resumed run) carries out the steps that fell due
+    meanwhile straight away, ramps continue from where they would be by now.
+    """
+    setpoint_signal = pyqtSignal(float)
+    select_signal = pyqtSignal(int)
+    pps_signal = pyqtSignal(object)   # dict with voltage, current, mode and/or output
+    stop_signal = pyqtSignal()
+    step_signal = pyqtSignal(str)     # Journal line of every step
+    finished = pyqtSignal()
+
+    def __init__(self, recipe, setpoint, journal_path, start=None):
+        super().__init__()
+        self.recipe = recipe
+        self.setpoint = setpoint
+        self.journal_path = journal_path
+        self.start = time.monotonic() if start is None else start
+        self.timed = sorted((step for step in recipe["steps"] if "at" in step), key=lambda step: step["at"])
+        self.charged = sorted((step for step in recipe["steps"] if "when_coulombs" in step),
+                              key=lambda step: step["when_coulombs"])
+        self.ramp = None  # (start time, from, to, over)
+        self.ramp_next = 0.0
+        self.ramp_interval = 5.0
+        self.coulombs = 0.0
+        self.wake = threading.Event()
+        self.max_sleep = 0.5  # Coulomb steps are checked at least this often
+        self.is_running = True
+
+    def update_coulombs(self, coulombs):
+        # Called from the GUI thread
+        self.coulombs = coulombs
+
+    def run(self):
+        self.journal(f"Recipe {self.recipe['name'] or self.recipe['path']} started")
+        while self.is_running and (self.timed or self.charged or self.ramp):
+            now = time.monotonic()
+            while self.timed and self.start + self.timed[0]["at"] <= now:
+                self.execute(self.timed.pop(0), now)
+            while self.charged and self.coulombs >= self.charged[0]["when_coulombs"]:
+                self.execute(self.charged.pop(0), now)
+            if self.ramp and now >= self.ramp_next:
+                self.ramp_next = self.step_ramp(now)
+            next_due = self.start + self.timed[0]["at"] if self.timed else now + self.max_sleep
+            if self.ramp:
+                next_due = min(next_due, self.ramp_next)
+            self.wake.wait(min(max(next_due - time.monotonic(), 0.0), self.max_sleep))
+        # stop() only clears is_running, the journal is written here
+        self.journal("Recipe finished" if self.is_running else "Recipe stopped")
+        self.is_running = False
+        self.finished.emit()
+
+    def step_ramp(self, now):
+        """Send the ramp setpoint for *now* and return when the next one is due."""
+        start, begin, end, over = self.ramp
+        fraction = 1.0 if over <= 0 else min((now - start) / over, 1.0)
+        self.setpoint = round(begin + (end - begin) * fraction, 2)
+        self.setpoint_signal.emit(self.setpoint)
+        if fraction >= 1.0:
+            self.ramp = None
+            self.journal(f"Ramp reached pH {end:.2f}")
+            return now + self.max_sleep
+        return now + self.ramp_interval
+
+    def execute(self, step, now):
+        if "at" in step:
+            planned = f"planned {step['at']:.1f} s, late {now - self.start - step['at']:.3f} s"
+        else:
+            planned = f"at {self.coulombs:.1f} C"
+        self.journal(f"Step {step['number']}: {describe(step)} ({planned})")
+        if "select" in step:
+            self.select_signal.emit(step["select"])
+        if "setpoint" in step:
+            self.setpoint = step["setpoint"]
+            self.ramp = None
+            self.setpoint_signal.emit(self.setpoint)
+        if "ramp" in step:
+            begin = self.start + step["at"] if "at" in step else now
+            self.ramp = (begin, self.setpoint, step["ramp"]["to"], step["ramp"]["over"])
+            self.ramp_next = now
+        if "pps" in step:
+            self.pps_signal.emit(dict(step["pps"]))
+        if step.get("stop"):
+            self.timed = []
+            self.charged = []
+            self.ramp = None
+            self.stop_signal.emit()
+
+    def journal(self, text):
+        line = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} [{time.monotonic() - self.start:10.1f} s] {text}"
+        with open(self.journal_path, "a") as f:
+            f.write(line + "\n")
+        self.step_signal.emit(line)
+
+    def elapsed(self):
+        # Read from the GUI thread for the checkpoint
+        return time.monotonic() - self.start
+
+    def stop(self):
+        # Called from the GUI thread, run() journals the stop
+        self.is_running = False
+        self.wake.set()
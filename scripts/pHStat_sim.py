@@ -0,0 +1,197 @@
+import random
+import threading
+import time
+
+from scripts.atlas import atlas_i2c, EZO_SUCCESS, EZO_PENDING, EZO_NO_DATA
+
+FARADAY = 96485.0  # C/mol
+
+class TitrationPlant:
+    """Buffered solution in one reactor, for running the pH-stat without hardware.
+
+    SimEZO, SimMosInd and SimPPS stand in for atlas_i2c, lib8mosind and
+    voltcraft.pps.PPS and all act on the same plant, so pump pulses and
+    electrolysis current show up in the simulated pH and temperature. The
+    plant is integrated lazily whenever a fake device is used.
+    """
+
+    def __init__(self, pH=7.0, temp=20.0, volume_ml=100.0, buffer_capacity=0.01,
+                 titrant_conc=0.1, flow_ml_s=0.49, electrolysis_sign=-1,
+                 mixing_tau=4.0, resistance=5.0, speed=1.0):
+        self.lock = threading.Lock()
+        self.pH = pH                # Bulk pH
+        self.probe_pH = pH          # What the electrode sees, lags the bulk
+        self.temp = temp
+        self.ambient = temp
+        self.volume_ml = volume_ml
+        self.buffer_capacity = buffer_capacity  # mol/(L pH)
+        self.flow_ml_s = flow_ml_s              # Pump flow at full duty
+        self.mixing_tau = mixing_tau            # s, mixing plus electrode response
+        self.resistance = resistance            # Ohm, cell resistance seen by the PPS
+        self.electrolysis_sign = electrolysis_sign  # -1: the current acidifies the solution
+        self.speed = speed                      # Plant time runs this much faster than real time
+        # MOSFET channel -> titrant concentration in mol/L, positive for base
+        self.reagents = {1: titrant_conc, 2: -titrant_conc}
+        self.duty = {}      # MOSFET channel -> 0..1 currently applied
+        self.current = 0.0  # A through the cell
+        self.power = 0.0    # W dissipated in the cell
+        self.pumped_ml = 0.0
+        self.last = time.monotonic()
+
+    def advance(self):
+        """Integrate the plant up to now. Call with self.lock held."""
+        now = time.monotonic()
+        dt = (now - self.last) * self.speed
+        self.last = now
+        if dt <= 0:
+            return
+
+        mol = 0.0
+        for channel, duty in self.duty.items():
+            if duty:
+                ml = self.flow_ml_s * duty * dt
+                self.pumped_ml += ml
+                mol += self.reagents.get(channel, 0.0) * ml / 1000
+        mol += self.electrolysis_sign * self.current * dt / FARADAY
+        self.volume_ml += sum(self.flow_ml_s * duty * dt for duty in self.duty.values())
+        self.pH += mol / (self.buffer_capacity * self.volume_ml / 1000)
+        self.pH = min(max(self.pH, 0.0), 14.0)
+
+        # First order lag of the electrode behind the bulk
+        self.probe_pH += (self.pH - self.probe_pH) * min(dt / self.mixing_tau, 1.0)
+        # Joule heating against losses to the room
+        self.temp += (self.ambient + 0.5 * self.power - self.temp) * min(dt / 600.0, 1.0)
+
+    def set_duty(self, channel, duty):
+        with self.lock:
+            self.advance()
+            self.duty[channel] = duty
+
+    def read_pH(self):
+        with self.lock:
+            self.advance()
+            return self.probe_pH + random.gauss(0, 0.003)
+
+    def read_temp(self):
+        with self.lock:
+            self.advance()
+            return self.temp + random.gauss(0, 0.02)
+
+    def set_electrical(self, current, power):
+        with self.lock:
+            self.advance()
+            self.current = current
+            self.power = power
+
+class SimEZO(atlas_i2c):
+    """An EZO circuit of the given kind answering from the plant, with the real read delays."""
+
+    def __init__(self, plant, address, kind):
+        self.plant = plant
+        self.address = address
+        self.kind = kind.upper()
+        self.ready_at = None  # When the answer to the last command is available
+        self.answer = ""
+
+    def write(self, string):
+        command = string.upper()
+        if command.startswith("R"):
+            delay = self.read_delay(self.kind)
+        elif command.startswith("CAL"):
+            delay = 0.9
+        else:
+            delay = self.short_timeout
+        self.ready_at = time.monotonic() + delay
+        self.answer = command
+
+    def read_response(self, num_of_bytes = 31):
+        if self.ready_at is None:
+            return EZO_NO_DATA, ""
+        if time.monotonic() < self.ready_at:
+            return EZO_PENDING, ""
+        command = self.answer
+        self.ready_at = None
+        if not command.startswith("R"):
+            return EZO_SUCCESS, ""
+        if self.kind == "RTD":
+            return EZO_SUCCESS, f"{self.plant.read_temp():.3f}"
+        return EZO_SUCCESS, f"{self.plant.read_pH():.3f}"
+
+    def exchange_response(self, string, num_of_bytes = 31):
+        result = self.read_response(num_of_bytes)
+        self.write(string)
+        return result
+
+    def close(self):
+        pass
+
+class SimMosInd:
+    """Drop-in for the lib8mosind module driving the plant's pumps (channels 1-8)."""
+
+    def __init__(self, plant):
+        self.plant = plant
+        self.state = [0] * 9
+        self.pwm = [0] * 9
+
+    def set(self, stack, mosfet, value):
+        self.state[mosfet] = 1 if value else 0
+        self.plant.set_duty(mosfet, self.state[mosfet] * (self.pwm[mosfet] or 100) / 100)
+
+    def get(self, stack, mosfet):
+        return self.state[mosfet]
+
+    def set_all(self, stack, value):
+        for mosfet in range(1, 9):
+            self.set(stack, mosfet, value & (1 << (mosfet - 1)))
+
+    def get_all(self, stack):
+        return sum(1 << (mosfet - 1) for mosfet in range(1, 9) if self.state[mosfet])
+
+    def set_pwm(self, stack, mosfet, value):
+        self.pwm[mosfet] = value
+        self.state[mosfet] = 1 if value else 0
+        self.plant.set_duty(mosfet, value / 100)
+
+    def get_pwm(self, stack, mosfet):
+        return self.pwm[mosfet]
+
+class SimPPS:
+    """Stand-in for voltcraft.pps.PPS driving the cell of the plant."""
+    VMAX = 36.0
+    IMAX = 10.0
+    VMIN = 0.8
+    MODEL = "SIM-PPS"
+
+    def __init__(self, plant):
+        self.plant = plant
+        self._voltage = 0.0
+        self._current = 0.0
+        self._output = False
+
+    def _apply(self):
+        if not self._output:
+            self.plant.set_electrical(0.0, 0.0)
+            return 0.0, 0.0, "CV"
+        amps = self._voltage / self.plant.resistance
+        mode = "CV"
+        if amps > self._current:
+            amps = self._current
+            mode = "CC"
+        volts = amps * self.plant.resistance
+        self.plant.set_electrical(amps, volts * amps)
+        return volts, amps, mode
+
+    def reading(self):
+        return self._apply()
+
+    def voltage(self, value):
+        self._voltage = min(max(value, 0.0), self.VMAX)
+        self._apply()
+
+    def current(self, value):
+        self._current = min(max(value, 0.0), self.IMAX)
+        self._apply()
+
+    def output(self, enable):
+        self._output = bool(enable)
+        self._apply()
@@ -0,0 +1,125 @@
+import glob
+import os
+import struct
+import time
+
+import numpy as np
+
+STORE_MAGIC = b"PHCS"
+STORE_VERSION = 1
+# magic, version, number of columns, time.time() when the chunk was started
+STORE_HEADER = struct.Struct("<4sHHd")
+# Name and unit of every column, after the header
+STORE_COLUMN = struct.Struct("<32s16s")
+STORE_SUFFIX = ".phs"
+
+def split_header(header):
+    """"Temperature (°C)" -> ("Temperature", "°C"), "pH" -> ("pH", "")."""
+    if header.endswith(")") and " (" in header:
+        name, unit = header[:-1].split(" (", 1)
+        return name, unit
+    return header, ""
+
+def chunk_paths(base):
+    return sorted(glob.glob(glob.escape(base) + "_[0-9][0-9][0-9][0-9]" + STORE_SUFFIX))
+
+def read_chunk_header(path):
+    """Return (columns, units, started, header size) of one chunk file."""
+    with open(path, "rb") as f:
+        magic, version, count, started = STORE_HEADER.unpack(f.read(STORE_HEADER.size))
+        if magic != STORE_MAGIC or version != STORE_VERSION:
+            raise ValueError(f"{path} is not a version {STORE_VERSION} session store")
+        columns, units = [], []
+        for _ in range(count):
+            name, unit = STORE_COLUMN.unpack(f.read(STORE_COLUMN.size))
+            columns.append(name.rstrip(b"\0").decode("utf-8"))
+            units.append(unit.rstrip(b"\0").decode("utf-8"))
+    return columns, units, started, STORE_HEADER.size + count * STORE_COLUMN.size
+
+def map_chunk(path):
+    """Map the complete rows of a chunk read-only, as an (n, columns) float64 array."""
+    columns, units, started, offset = read_chunk_header(path)
+    # A torn last row from a crash is ignored
+    rows = (os.path.getsize(path) - offset) // (8 * len(columns))
+    if rows == 0:
+        return columns, np.empty((0, len(columns)))
+    return columns, np.memmap(path, dtype="<f8", mode="r", offset=offset, shape=(rows, len(columns)))
+
+class SessionStore:
+    """Append-only binary log of a session, one float64 column per channel.
+
+    Rows go to <base>_0000.phs, <base>_0001.phs, ... with chunk_rows rows per
+    file. Every chunk starts with a STORE_HEADER and the name and unit of each
+    column, so each one can be mapped on its own by map_chunk(). The first
+    column is the reaction time in s, channels without a value in a row hold
+    NaN.
+    """
+
+    def __init__(self, base, headers, chunk_rows=2**16):
+        self.base = base
+        self.columns = ["Reaction time"] + [split_header(header)[0] for header in headers]
+        self.units = ["s"] + [split_header(header)[1] for header in headers]
+        self.chunk_rows = chunk_rows
+        self.file = None
+        paths = chunk_paths(base)
+        if paths:
+            # Continuing a session, append to the last chunk
+            self.chunk = len(paths) - 1
+            _, _, _, offset = read_chunk_header(paths[-1])
+            self.rows = (os.path.getsize(paths[-1]) - offset) // self.row_size
+            # Drop a torn last row so new ones stay aligned
+            os.truncate(paths[-1], offset + self.rows * self.row_size)
+            self.file = open(paths[-1], "ab")
+        else:
+            self.chunk = -1
+            self.next_chunk()
+
+    @property
+    def row_size(self):
+        return 8 * len(self.columns)
+
+    def path(self, chunk):
+        return f"{self.base}_{chunk:04d}{STORE_SUFFIX}"
+
+    def next_chunk(self):
+        if self.file is not None:
+            self.file.close()
+        self.chunk += 1
+        self.rows = 0
+        self.file = open(self.path(self.chunk), "wb")
+        self.file.write(STORE_HEADER.pack(STORE_MAGIC, STORE_VERSION, len(self.columns), time.time()))
+        for name, unit in zip(self.columns, self.units):
+            self.file.write(STORE_COLUMN.pack(name.encode("utf-8")[:32], unit.encode("utf-8")[:16]))
+
+    def append(self, elapsed, values):
+        """Add one row, None in *values* is stored as NaN."""
+        if self.rows >= self.chunk_rows:
+            self.next_chunk()
+        row = np.array([elapsed] + [np.nan if value is None else value for value in values], dtype="<f8")
+        self.file.write(row.tobytes())
+        self.file.flush()
+        self.rows += 1
+
+    def close(self):
+        self.file.close()
+
+def read_store(base):
+    """Return {column name: array} with every row of the session.
+
+    A session of a single chunk comes back as views into the mapped file.
+    """
+    parts = []
+    columns = None
+    for path in chunk_paths(base):
+        columns, rows = map_chunk(path)
+        if len(rows):
+            parts.append(rows)
+    if columns is None:
+        return {}
+    table = parts[0] if len(parts) == 1 else (np.concatenate(parts) if parts else np.empty((0, len(columns))))
+    return {name: table[:, i] for i, name in enumerate(columns)}
+
+def store_started(base):
+    """time.time() at the start of the session, from the header of its first chunk."""
+    paths = chunk_paths(base)
+    return read_chunk_header(paths[0])[2] if paths else None
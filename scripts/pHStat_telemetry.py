@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+import time
+
+# Upper bounds of the latency histogram buckets in milliseconds, the last one catches the rest
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, float("inf")]
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max, 3),
+            "buckets_ms": {("inf" if bound == float("inf") else str(bound)): n
+                           for bound, n in zip(BUCKETS_MS, self.counts)},
+        }
+
+class BusTelemetry:
+    """Counters for everything that talks to the I2C bus, safe to update from any thread.
+
+    Devices are keyed by a label: the probe name for EZO circuits and
+    "MOSFET" for the pump board.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.devices = {}
+        self.mutex_wait = Histogram()
+        self.incidents = []  # (time, label, what), newest last
+        self.max_incidents = 100
+
+    def _device(self, label):
+        device = self.devices.get(label)
+        if device is None:
+            device = {"latency": Histogram(), "errors": {}, "retries": 0, "busy": 0, "last_sample": None}
+            self.devices[label] = device
+        return device
+
+    def record_transaction(self, label, seconds):
+        with self.lock:
+            self._device(label)["latency"].add(seconds)
+
+    def record_mutex_wait(self, seconds):
+        with self.lock:
+            self.mutex_wait.add(seconds)
+
+    def record_error(self, label, what):
+        with self.lock:
+            errors = self._device(label)["errors"]
+            errors[what] = errors.get(what, 0) + 1
+
+    def record_retry(self, label):
+        with self.lock:
+            self._device(label)["retries"] += 1
+
+    def record_busy(self, label):
+        # An EZO circuit answered "still processing"
+        with self.lock:
+            self._device(label)["busy"] += 1
+
+    def record_incident(self, label, what):
+        # Something the safety checks had to step in for
+        with self.lock:
+            self.incidents.append((time.strftime("%Y-%m-%d %H:%M:%S"), label, what))
+            del self.incidents[:-self.max_incidents]
+            errors = self._device(label)["errors"]
+            errors["incident"] = errors.get("incident", 0) + 1
+
+    def record_sample(self, label, timestamp):
+        # timestamp is time.monotonic() at acquisition
+        with self.lock:
+            self._device(label)["last_sample"] = timestamp
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self.lock:
+            devices = {}
+            for label, device in self.devices.items():
+                last = device["last_sample"]
+                devices[label] = {
+                    "latency": device["latency"].as_dict(),
+                    "errors": dict(device["errors"]),
+                    "retries": device["retries"],
+                    "busy": device["busy"],
+                    "sample_age_s": None if last is None else round(now - last, 3),
+                }
+            return {
+                "since": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+                "uptime_s": round(time.time() - self.started, 1),
+                "mutex_wait": self.mutex_wait.as_dict(),
+                "devices": devices,
+                "incidents": [{"time": t, "device": label, "what": what} for t, label, what in self.incidents],
+            }
+
+    def format_report(self):
+        snap = self.snapshot()
+        lines = [f"Since {snap['since']} ({snap['uptime_s']:.0f} s)", ""]
+        wait = snap["mutex_wait"]
+        lines.append(f"i2c_mutex wait: n={wait['count']} mean={wait['mean_ms']:.2f} ms max={wait['max_ms']:.2f} ms")
+        lines.append("")
+        for label, device in sorted(snap["devices"].items()):
+            latency = device["latency"]
+            age = device["sample_age_s"]
+            errors = ", ".join(f"{what}={n}" for what, n in device["errors"].items()) or "none"
+            lines.append(f"[{label}]")
+            lines.append(f"  transactions {latency['count']}  mean {latency['mean_ms']:.2f} ms  max {latency['max_ms']:.2f} ms")
+            lines.append("  histogram " + "  ".join(f"<={bound}:{n}" for bound, n in latency["buckets_ms"].items() if n))
+            lines.append(f"  errors {errors}  retries {device['retries']}  busy {device['busy']}")
+            if age is not None:
+                lines.append(f"  last sample {age:.1f} s ago")
+        if snap["incidents"]:
+            lines.append("")
+            lines.append("Incidents")
+            for incident in snap["incidents"]:
+                lines.append(f"  {incident['time']} [{incident['device']}] {incident['what']}")
+        return "\n".join(lines)
+
+    def dump(self, folder):
+        """Write the current snapshot to <folder>/I2C_telemetry.json, replacing the previous dump."""
+        path = os.path.join(folder, "I2C_telemetry.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+telemetry = BusTelemetry()
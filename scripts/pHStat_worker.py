@@ -1,237 +1,453 @@
-from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot, QCoreApplication, QWaitCondition, QMutex
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot, QMutex
 import time
+import queue
 #from pyudev import Context, Monitor
 import subprocess
-from pyudev import Context
+from collections import namedtuple
+try:
+    from pyudev import Context
+except ImportError:
+    Context = None  # No USB stick detection, e.g. simulating on a desktop
+from scripts.atlas import EZOError, EZO_SUCCESS, EZO_PENDING
+from scripts.pHStat_telemetry import telemetry
+from scripts.pHStat_control import Trend, ResponseEstimator
 
 i2c_mutex = QMutex()
 
-class pHWorker(QObject):
-    update_signal_pH = pyqtSignal(float,object)  # Define the signal to emit data
-    
-    def __init__(self, send_counter, test_time, read, data, dev, temp):
+def lock_i2c():
+    """Lock i2c_mutex, recording how long we had to wait for it."""
+    start = time.monotonic()
+    i2c_mutex.lock()
+    telemetry.record_mutex_wait(time.monotonic() - start)
+
+# One fresh reading of a probe. device is the probe name from settings.ini and
+# type its GUI channel (1 pH, 2 RTD, None for additional probes). temp is the
+# compensation temperature the probe used (None when not compensated), seq
+# counts the readings of that device, timestamp is time.monotonic() at
+# acquisition and quality one of QUALITY_*.
+Sample = namedtuple("Sample", "device type value temp seq timestamp quality")
+
+QUALITY_OK = "ok"
+QUALITY_NO_PROBE = "no probe"            # RTD circuit without a sensor attached
+QUALITY_UNCOMPENSATED = "uncompensated"  # No temperature available yet
+
+# How StatWorker doses, as stored in settings.ini
+DOSING_PULSE = "pulse"  # Discrete pulses with a cooldown in between
+DOSING_PWM = "pwm"      # Continuous flow through the MOSFET PWM duty
+
+# One delivered pump pulse. commanded and measured are in seconds, measured
+# runs from the confirmed on write to the confirmed off write. start is
+# time.monotonic() of the on edge, test marks calibration pulses. For a pwm
+# segment of continuous dosing commanded is its length and measured the
+# equivalent time at full output.
+Pulse = namedtuple("Pulse", "channel commanded measured start test pwm", defaults=(False,))
+
+class BusWorker(QObject):
+    """Owns one I2C bus and pipelines the "R" commands of every EZO device on it.
+
+    Each device gets its own ready deadline: when it expires the previous
+    result is read and the next "R" is written straight away, so the probes
+    measure in parallel and this thread only sleeps until the earliest deadline.
+    A probe that answers "still processing" is polled again with a short
+    backoff, and its deadline is stretched so the next cycle lands on time.
+
+    A device with an interval longer than its read delay is read alone and
+    gets its next "R" once the interval is over.
+
+    A device can be compensated by the samples of another probe on the same
+    bus (pH by RTD): its read then becomes "RT,<temp>" whenever the latest
+    temperature moved more than temp_deadband from the one the probe is using.
+    """
+    update_signal = pyqtSignal(object)  # Sample
+
+    def __init__(self, probes):
         super().__init__()
         self.is_running = True
-        self.should_log = False
-        self.pH_send_counter = send_counter
-        self.pH_read = read
-        self.pH_data = data
-        self.pH_test_time = test_time
-        self.pH_dev = dev
-        self.pH_temp = temp
-        self.pH_path = ""
-        self.is_paused = False  # Pause control
-        self.pause_condition = QWaitCondition()  # Condition for pausing
-        self.mutex = QMutex()  # Mutex for condition
+        # probes: dicts from ProbeReader with the opened atlas_i2c under "dev"
+        self.slots = []
+        self.latest = {}  # probe name -> last value read, used for compensation
+        for probe in probes:
+            dev = probe["dev"]
+            self.slots.append({
+                "name": probe["name"],
+                "kind": probe["kind"].upper(),
+                "dev": dev,
+                "type": probe["channel"],
+                "delay": dev.read_delay(probe["kind"]),
+                "interval": probe["interval"],
+                "compensate": probe["compensate"],
+                "comp_temp": None,     # Compensation the probe currently uses
+                "pending_temp": None,  # Compensation of the reading in flight
+                "deadline": 0.0,
+                "issued": 0.0,     # When the pending "R" went out
+                "pending": False,  # an "R" was written and its result is not read yet
+                "exchange": True,  # Read the result and send the next "R" in one transaction
+                "backoff": dev.min_poll,
+                "data": 0.0,
+                "seq": 0,
+                "paused": False,
+            })
+        self.max_sleep = 0.1  # Keeps stop/pause responsive
+        self.delay_step = 0.05  # Added to a device's delay each time it was read too early
+        self.temp_deadband = 0.1  # °C, smaller changes are not sent to the probe
+        self.min_valid_temp = -200  # The RTD reports -1023 without a probe attached
 
     def run(self):
-        # Background task logic            
         while self.is_running:
-            self.mutex.lock()
-            if self.is_paused:
-                self.pause_condition.wait(self.mutex)  # Wait until unpaused
-            self.mutex.unlock()
-
-            if self.pH_send_counter < time.time():
-                if self.pH_read:
-                    #self.pH_data, self.pH_test_time = self.pH_test(self.pH_data, self.pH_test_time)
-                    try:
-                        #print(f"Worker trying to lock i2c_mutex for read operation")
-                        i2c_mutex.lock()
-                        #print(f"i2c_mutex locked for read operation")
-                        self.pH_data = float(self.pH_dev.read())
-                        #print(f"Read data: {self.pH_data}")
-
-                    except Exception as e:
-                        print(f"Error reading {e}")
-                    finally:
-                        #print(f"i2c_mutex unlocked after read operation")
-                        i2c_mutex.unlock()
-                try:
-                    #print(f"Worker trying to lock i2c_mutex for write operation")
-                    i2c_mutex.lock()
-                    #print(f"i2c_mutex locked for write operation")
-                    #self.pH_dev.write(f'RT,{self.pH_temp}')
-                    self.pH_dev.write(f'R')
-                
-                except Exception as e:
-                    print(f"Error writing {e}")
-                finally:
-                    #print(f"i2c_mutex unlocked after write operation")
-                    i2c_mutex.unlock()
-                
-                
-                
-                self.pH_send_counter = time.time() + 0.9
-                self.pH_read = True
+            now = time.monotonic()
+            for slot in self.slots:
+                if slot["paused"] or slot["deadline"] > now:
+                    continue
+                if slot["pending"]:
+                    self.read_slot(slot)
+                else:
+                    self.write_slot(slot)
+
+            deadlines = [slot["deadline"] for slot in self.slots if not slot["paused"]]
+            if deadlines:
+                wait = min(deadlines) - time.monotonic()
             else:
-                pass
+                wait = self.max_sleep
+            if wait > 0:
+                time.sleep(min(wait, self.max_sleep))
 
-            self.update_signal_pH.emit(self.pH_data, 1)  # Emit signal with data
+    def next_command(self, slot):
+        """Return the read command for *slot* and the compensation it carries."""
+        if slot["compensate"] is None:
+            return "R", None
+        temp = self.latest.get(slot["compensate"])
+        if temp is None or temp < self.min_valid_temp:
+            return "R", slot["comp_temp"]
+        temp = round(temp, 1)
+        if slot["comp_temp"] is None or abs(temp - slot["comp_temp"]) > self.temp_deadband:
+            return f"RT,{temp}", temp
+        return "R", slot["comp_temp"]
 
-            time.sleep(0.9)  # Adjust the sleep time as needed
+    def read_slot(self, slot):
+        dev = slot["dev"]
+        used_temp = slot["pending_temp"]
+        command, temp = self.next_command(slot)
+        # Only hand over the next "R" when the device is due for it again
+        exchange = slot["exchange"] and time.monotonic() >= slot["issued"] + slot["interval"]
+        try:
+            lock_i2c()
+            start = time.monotonic()
+            if exchange:
+                status, payload = dev.exchange_response(command)
+            else:
+                status, payload = dev.read_response()
+            telemetry.record_transaction(slot["name"], time.monotonic() - start)
+        except Exception as e:
+            print(f"Error reading {e}")
+            telemetry.record_error(slot["name"], "read")
+            slot["pending"] = False
+            slot["comp_temp"] = None  # Unknown whether the command arrived
+            return
+        finally:
+            i2c_mutex.unlock()
 
-    def pause(self):
-        print("Pause")
-        self.mutex.lock()
-        self.is_paused = True
-        self.mutex.unlock()     
-    
-    def resume(self):
-        self.is_paused = False
-        self.mutex.lock()
-        self.pause_condition.wakeAll()  # Resume execution
-        self.mutex.unlock()
+        now = time.monotonic()
+        if status == EZO_PENDING:
+            telemetry.record_busy(slot["name"])
+            if exchange:
+                # The next "R" went out while the probe was still busy and
+                # restarted its reading: wait a bit longer from now on
+                slot["exchange"] = False
+                slot["delay"] += self.delay_step
+                self.sent(slot, temp)
+                slot["issued"] = now
+                slot["deadline"] = now + slot["delay"]
+            elif now - slot["issued"] > dev.long_timeout:
+                print(f"Error reading {EZOError(status)}")
+                telemetry.record_error(slot["name"], "timeout")
+                slot["pending"] = False
+            else:
+                slot["deadline"] = now + slot["backoff"]
+                slot["backoff"] = min(slot["backoff"] * 2, dev.max_poll)
+            return
 
-    def stop(self):
-        self.is_running = False
-        self.resume()  # Ensure the worker wakes up to stop
+        slot["backoff"] = dev.min_poll
+        if status == EZO_SUCCESS:
+            try:
+                slot["data"] = float(payload)
+                self.latest[slot["name"]] = slot["data"]
+                slot["seq"] += 1
+                self.update_signal.emit(Sample(slot["name"], slot["type"], slot["data"], used_temp,
+                                               slot["seq"], now, self.quality(slot, used_temp)))
+                telemetry.record_sample(slot["name"], now)
+            except ValueError as e:
+                print(f"Error reading {e}")
+                telemetry.record_error(slot["name"], "parse")
+        else:
+            print(f"Error reading {EZOError(status)}")
+            telemetry.record_error(slot["name"], f"status {status}")
 
-    def pH_test(self, data, test_time):
-        increment = time.time() - test_time
-        test_time = time.time()
-        data += increment/25
-        return data, test_time
-    
-class RTDWorker(QObject):
-    update_signal_RTD = pyqtSignal(float,object)  # Define the signal to emit data
+        if exchange:
+            # The next read already went out in the same transaction
+            self.sent(slot, temp)
+            slot["issued"] = now
+            slot["deadline"] = now + slot["delay"]
+        elif now >= slot["issued"] + slot["interval"]:
+            slot["exchange"] = True
+            self.write_slot(slot)
+        else:
+            slot["exchange"] = True
+            slot["pending"] = False
+            slot["deadline"] = slot["issued"] + slot["interval"]
 
-    def __init__(self, send_counter, test_time, read, data, dev):
-        super().__init__()
-        self.is_running = True
-        self.should_log = False
-        self.RTD_send_counter = send_counter
-        self.RTD_read = read
-        self.RTD_data = data
-        self.RTD_test_time = test_time
-        self.RTD_dev = dev
-        self.RTD_path = ""
-        self.RTD_is_paused = False  # Pause control
-        self.RTD_pause_condition = QWaitCondition()  # Condition for pausing
-        self.RTD_mutex = QMutex()  # Mutex for condition
+    def quality(self, slot, used_temp):
+        if slot["kind"] == "RTD" and slot["data"] < self.min_valid_temp:
+            return QUALITY_NO_PROBE
+        if slot["compensate"] is not None and used_temp is None:
+            return QUALITY_UNCOMPENSATED
+        return QUALITY_OK
 
-    def run(self):
-        # Background task logic
-         while self.is_running:
-            self.RTD_mutex.lock()
-            if self.RTD_is_paused:
-                self.RTD_pause_condition.wait(self.RTD_mutex)  # Wait until unpaused
-            self.RTD_mutex.unlock()
-            
-            if self.RTD_send_counter < time.time():
-                if self.RTD_read:
-                    #self.RTD_data, self.RTD_test_time = self.RTD_test(self.RTD_data, self.RTD_test_time)
-                    try:
-                        #print(f"Worker trying to lock i2c_mutex for read operation")
-                        i2c_mutex.lock()
-                        #print(f"i2c_mutex locked for read operation")
-                        self.RTD_data = float(self.RTD_dev.read())
-                        #print(f"Read data: {self.RTD_data}")
-
-                    except Exception as e:
-                        print(f"Error reading {e}")
-                    finally:
-                        #print(f"i2c_mutex unlocked after read operation")
-                        i2c_mutex.unlock()
-                    
-                try:
-                    #print(f"Worker trying to lock i2c_mutex for write operation")
-                    i2c_mutex.lock()
-                    #print(f"i2c_mutex locked for write operation")
-                    self.RTD_dev.write("R")
-                except Exception as e:
-                    print(f"Error writing {e}")
-                finally:
-                    #print(f"i2c_mutex unlocked after write operation")
-                    i2c_mutex.unlock()    
-    
-                
-                self.RTD_send_counter = time.time() + 0.6
-                self.RTD_read = True
-            else:
-                pass
+    def sent(self, slot, temp):
+        slot["pending_temp"] = temp
+        slot["comp_temp"] = temp
 
-            self.update_signal_RTD.emit(self.RTD_data, 2)  # Emit signal with data
-            time.sleep(0.7)  # Adjust the sleep time as needed
+    def write_slot(self, slot):
+        slot["pending"] = False
+        command, temp = self.next_command(slot)
+        try:
+            lock_i2c()
+            start = time.monotonic()
+            slot["dev"].write(command)
+            telemetry.record_transaction(slot["name"], time.monotonic() - start)
+            slot["pending"] = True
+            self.sent(slot, temp)
+        except Exception as e:
+            print(f"Error writing {e}")
+            telemetry.record_error(slot["name"], "write")
+        finally:
+            i2c_mutex.unlock()
+        slot["issued"] = time.monotonic()
+        slot["deadline"] = slot["issued"] + slot["delay"]
+
+    def pause(self, dev=None):
+        """Stop polling *dev* (or every device) so the GUI can talk to it directly."""
+        print("Pause")
+        for slot in self.slots:
+            if dev is None or slot["dev"] is dev:
+                slot["paused"] = True
+                slot["pending"] = False
+                slot["comp_temp"] = None  # Send the temperature again after a resume
+
+    def resume(self, dev=None):
+        for slot in self.slots:
+            if dev is None or slot["dev"] is dev:
+                slot["deadline"] = 0.0
+                slot["exchange"] = True
+                slot["paused"] = False
 
     def stop(self):
         self.is_running = False
-    
-    def pause(self):
-        print("Pause")
-        self.RTD_mutex.lock()
-        self.RTD_is_paused = True
-        self.RTD_mutex.unlock()     
-    
-    def resume(self):
-        self.RTD_is_paused = False
-        self.RTD_mutex.lock()
-        self.RTD_pause_condition.wakeAll()  # Resume execution
-        self.RTD_mutex.unlock()
-    
-    def RTD_test(self, data, test_time):
-        increment = time.time() - test_time
-        test_time = time.time()
-        data += increment/10
-        return data, test_time
 
 
 class StatWorker(QObject):
+    """pH-stat controller, re-evaluated only when a new pH sample or setting arrives.
+
+    The worker has no loop of its own: its slots run from the event loop of
+    the thread it is moved to. status_signal is only emitted when the pH
+    crosses the setpoint. Once the previous dose and its cooldown are over,
+    the controller (see pHStat_control) sizes the next dose, which goes out
+    through dose_signal as pump channel and seconds. The controller and
+    response only count it once PumpWorker reports the pump on through
+    pump_started(); a dose it dropped through pump_dropped() is asked again.
+
+    select 0 and 1 keep the pH above or below the setpoint with the pump on
+    pump_channel. select 2 keeps it within deadband of the setpoint, with
+    base on base_channel and acid on acid_channel; each direction then has
+    its own controller.
+
+    With DOSING_PWM there are no pulses: every sample, the dose the
+    controller asks for is spread over pwm_period seconds and sent through
+    duty_signal as a duty of 0..1. Only changes of at least duty_step go out.
+
+    response learns the dead time and time constant of the pH response to
+    each pulse. With adaptive set its cooldown is used instead of the fixed
+    one; every new estimate goes out through cooldown_signal.
+    """
     status_signal = pyqtSignal(bool)
-    pump_signal = pyqtSignal(bool)
-    def __init__(self, select, pHSelect , pH):
+    dose_signal = pyqtSignal(int, float)  # channel, pump seconds
+    duty_signal = pyqtSignal(int, float)  # channel, duty 0..1
+    cooldown_signal = pyqtSignal(float, float, float)  # delay, tau, cooldown in s
+    def __init__(self, select, pHSelect , pH, controllers, cooldown,
+                 pump_channel=1, base_channel=1, acid_channel=2, deadband=0.05,
+                 dosing=DOSING_PULSE, pwm_period=1.0,
+                 adaptive=False, min_cooldown=2.0, max_cooldown=60.0):
         super().__init__()
         self.pH = pH
+        self.pH_seq = 0
         self.should_start = False
         self.select = select
         self.pHSelect = pHSelect
+        self.status = None  # Last state sent through status_signal
+        self.controllers = controllers  # direction (1 raises the pH, -1 lowers it) -> controller
+        self.cooldown = cooldown
+        self.pump_channel = pump_channel
+        self.base_channel = base_channel
+        self.acid_channel = acid_channel
+        self.deadband = deadband
+        self.dosing = dosing
+        self.pwm_period = pwm_period
+        self.duty_step = 0.02
+        self.duties = {}  # channel -> last duty sent
+        self.adaptive = adaptive
+        self.response = ResponseEstimator(cooldown, min_cooldown, max_cooldown)
+        self.trend = Trend()
+        self.ready_time = 0.0  # time.monotonic() at which the next dose may start
+        self.pending = {}  # channel -> (controller, direction, seconds, error, slope) sent, not started yet
         self.is_running = True
     
     @pyqtSlot()
     def start_processing(self):
         self.should_start = not self.should_start
+        if self.should_start:
+            # Every run starts with empty integrators, nothing wound up while it was idle
+            for controller in self.controllers.values():
+                controller.reset()
+        self.pending = {}
+        self.evaluate()
 
-        #self.should_start = True
+    def evaluate(self, new_sample=False):
+        if not self.is_running:
+            return
+        band = 0.0
+        if self.select == 0:
+            ok = self.pH > self.pHSelect   # Keep above
+            pumps = ((1, self.pump_channel),)
+        elif self.select == 1:
+            ok = self.pH < self.pHSelect   # Keep below
+            pumps = ((-1, self.pump_channel),)
+        else:
+            ok = abs(self.pH - self.pHSelect) <= self.deadband   # Keep at
+            band = self.deadband
+            pumps = ((1, self.base_channel), (-1, self.acid_channel))
 
-    def run(self):
-        # Background task logic
-        while self.is_running:
-            if self.select == 0:
-                if self.pH > self.pHSelect:
-                    #print(f'Bigger then = True')
-
-                    self.status_signal.emit(True)
-                else: 
-                    #print(f'Bigger then = False')
-                    if self.should_start:
-                        self.pump_signal.emit(False)
-                    else:
-                        pass
-                    self.status_signal.emit(False)
-            else:
-                if self.pH < self.pHSelect:
-                    #print(f'Smaller then = True')
-                    self.status_signal.emit(True)
-                else:
-                    if self.should_start:
-                        self.pump_signal.emit(False)
-                    else:
-                        pass
-                    self.status_signal.emit(False)                        
-                    #print(f'Smaller then = False')
-            
-            QCoreApplication.processEvents()
-            time.sleep(0.1)
-            
-    
-    def update_pH(self, data, number):
-        self.pH = data
+        if ok != self.status:
+            self.status = ok
+            self.status_signal.emit(ok)
+
+        now = time.monotonic()
+        doses = []
+        for direction, channel in pumps:
+            # Error and slope in the direction this pump moves the pH
+            error = direction * (self.pHSelect - self.pH) - band
+            slope = direction * self.trend.slope
+            controller = self.controllers[direction]
+            if new_sample and self.should_start:
+                controller.update(error, slope, now)
+            doses.append((controller, direction, channel, error, slope))
+        if self.dosing == DOSING_PWM:
+            self.set_duties(doses, now)
+            return
+        if self.should_start and now >= self.ready_time:
+            for controller, direction, channel, error, slope in doses:
+                seconds = controller.dose(error, slope, now)
+                if seconds > 0:
+                    # Held off until pump_started() or pump_dropped() says what became of it
+                    self.ready_time = now + seconds + self.current_cooldown()
+                    self.pending[channel] = (controller, direction, seconds, error, slope)
+                    self.dose_signal.emit(channel, seconds)
+                    break
+
+    @pyqtSlot(int, bool)
+    def pump_started(self, channel, test):
+        if test or channel not in self.pending:
+            return
+        controller, direction, seconds, error, slope = self.pending.pop(channel)
+        now = time.monotonic()
+        controller.dosed(seconds, error, slope, now)
+        self.ready_time = now + seconds + self.current_cooldown()
+        if self.response.start(now + seconds, self.pH, self.trend.slope, direction):
+            self.report_cooldown()
+
+    @pyqtSlot(int, bool)
+    def pump_dropped(self, channel, test):
+        # The pump was still busy (e.g. a manual pulse), size the dose again on the next sample
+        if test or self.pending.pop(channel, None) is None:
+            return
+        self.ready_time = 0.0
+
+    def current_cooldown(self):
+        return self.response.cooldown if self.adaptive else self.cooldown
+
+    def report_cooldown(self):
+        response = self.response
+        self.cooldown_signal.emit(response.delay or 0.0, response.tau or 0.0, response.cooldown)
+
+    def set_duties(self, doses, now):
+        wanted = {channel: 0.0 for channel in self.duties}
+        if self.should_start:
+            for controller, direction, channel, error, slope in doses:
+                seconds = controller.dose(error, slope, now)
+                if seconds > 0:
+                    wanted[channel] = min(seconds / self.pwm_period, 1.0)
+                    controller.dosed(seconds, error, slope, now)
+                    break
+        for channel, duty in wanted.items():
+            last = self.duties.get(channel, 0.0)
+            if abs(duty - last) >= self.duty_step or (last and not duty):
+                self.duties[channel] = duty
+                self.duty_signal.emit(channel, duty)
+
+    @pyqtSlot(int, float)
+    def pump_duty_changed(self, channel, duty):
+        # The duty PumpWorker really runs, e.g. 0 after an abort, so a steady duty gets sent again
+        self.duties[channel] = duty
+
+    @pyqtSlot(bool)
+    def update_adaptive(self, adaptive):
+        self.adaptive = adaptive
+
+    @pyqtSlot(str)
+    def update_dosing(self, dosing):
+        if self.dosing == DOSING_PWM and dosing != DOSING_PWM:
+            for channel, duty in self.duties.items():
+                if duty:
+                    self.duty_signal.emit(channel, 0.0)
+            self.duties = {}
+        self.dosing = dosing
+        self.evaluate()
+
+    @pyqtSlot(object)
+    def update_pH(self, sample):
+        if sample.type == 1 and sample.seq != self.pH_seq:
+            self.pH = sample.value
+            self.pH_seq = sample.seq
+            self.trend.update(sample.value, sample.timestamp)
+            if self.response.sample(sample.value, sample.timestamp):
+                self.report_cooldown()
+            self.evaluate(new_sample=True)
+
+    @pyqtSlot(object, float)
+    def update_controller(self, controllers, cooldown):
+        self.controllers = controllers
+        self.cooldown = cooldown
+
+    def controller_state(self):
+        # Read from the GUI thread for the checkpoint, plain attribute reads only
+        return {"controllers": {str(direction): controller.state() for direction, controller in self.controllers.items()},
+                "response": self.response.state()}
+
+    @pyqtSlot(object)
+    def restore_state(self, state):
+        # Continue with the integrators and learned response of a checkpoint
+        for direction, controller in self.controllers.items():
+            controller.restore(state["controllers"].get(str(direction), {}))
+        self.response.restore(state["response"])
+        self.report_cooldown()
     
+    @pyqtSlot(int)
     def update_select(self,select):
         self.select = select
+        self.evaluate()
     
+    @pyqtSlot(float)
     def update_pH_select(self, pHSelect):
         self.pHSelect = pHSelect
+        self.evaluate()
     
     def stop(self):
         self.is_running = False
@@ -240,6 +456,313 @@ class StatWorker(QObject):
 
     
 
+class PumpWorker(QObject):
+    """Switches the pump MOSFETs from its own thread, timed against time.monotonic().
+
+    request(), set_duty() and abort() can be called from any thread. Every
+    channel runs its own pulse and cooldown, and all edges that fall due
+    together (acid off, base on, ...) go out as one set_all() bitmask write.
+    The thread sleeps until shortly before the next off deadline and spins
+    the last spin_margin seconds, so edges do not depend on the GUI event loop.
+    Requests for a channel that is pulsing or cooling down are dropped and
+    reported through pulse_dropped.
+
+    set_duty() runs a channel continuously through set_pwm() instead. Its
+    delivered on-time is reported as pwm Pulses, one per duty change and at
+    least every segment_length seconds.
+    """
+    pump_on = pyqtSignal(int, bool)       # channel, test
+    pulse_done = pyqtSignal(object)       # Pulse
+    pulse_dropped = pyqtSignal(int, bool) # channel, test
+    duty_changed = pyqtSignal(int, float) # channel, duty 0..1
+
+    def __init__(self, mosfet, stack=0):
+        super().__init__()
+        self.mosfet = mosfet
+        self.stack = stack
+        self.requests = queue.Queue()
+        self.mask = 0       # Channels that are switched on, bit 0 is MOSFET 1
+        self.active = {}    # channel -> (off deadline, on edge, commanded, cooldown, test)
+        self.ready_at = {}  # channel -> end of its cooldown
+        self.duty = {}      # channel -> (PWM percent, start of the running segment)
+        # (mask, ((channel, on edge, off deadline), ...), PWM mask, heartbeat)
+        # replaced as a whole after every tick, read by PumpWatchdog
+        self.published = (0, (), 0, time.monotonic())
+        self.spin_margin = 0.002
+        # Longest sleep while a pulse runs, so the heartbeat stays fresh for PumpWatchdog
+        self.heartbeat_interval = 0.25
+        self.segment_length = 5.0
+        self.retry_count = 5
+        self.retry_delay = 0.01
+        self.is_running = True
+
+    def request(self, channel, seconds, cooldown, test=False):
+        self.requests.put(("pulse", channel, seconds, cooldown, test))
+
+    def set_duty(self, channel, duty):
+        self.requests.put(("duty", channel, duty))
+
+    def abort(self):
+        # Switches every pump off now and drops queued requests
+        while True:
+            try:
+                item = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if item and item[0] == "pulse":
+                self.pulse_dropped.emit(item[1], item[4])
+        self.requests.put(None)
+
+    def run(self):
+        while self.is_running:
+            incoming = []
+            timeout = 0.1
+            if self.active:
+                remaining = min(edge[0] for edge in self.active.values()) - time.monotonic()
+                timeout = min(remaining - self.spin_margin, self.heartbeat_interval)
+            try:
+                if timeout > 0:
+                    incoming.append(self.requests.get(timeout=timeout))
+                while True:
+                    incoming.append(self.requests.get_nowait())
+            except queue.Empty:
+                pass
+            self.tick(incoming)
+            self.publish()
+        self.tick([None])
+        self.publish()
+
+    def publish(self):
+        pulses = tuple((channel, edge[1], edge[0]) for channel, edge in self.active.items())
+        pwm_mask = 0
+        for channel, (percent, since) in self.duty.items():
+            if percent:
+                pwm_mask |= 1 << (channel - 1)
+        self.published = (self.mask, pulses, pwm_mask, time.monotonic())
+
+    def tick(self, incoming):
+        now = time.monotonic()
+        if self.active and not incoming:
+            # Spin out the last bit before the next off edge, a heartbeat wake-up has nothing due
+            deadline = min(edge[0] for edge in self.active.values())
+            if deadline - now <= self.spin_margin:
+                while now < deadline:
+                    now = time.monotonic()
+
+        aborting = None in incoming
+        duties = {item[1]: item[2] for item in incoming if item and item[0] == "duty"}
+        if aborting:
+            duties = {channel: 0.0 for channel in self.duty}
+        for channel, duty in duties.items():
+            self.apply_duty(channel, duty)
+        self.flush_segments()
+
+        mask = self.mask
+        ending = [channel for channel, edge in self.active.items() if edge[0] <= now]
+        if aborting:
+            ending = list(self.active)
+            mask = 0
+        for channel in ending:
+            mask &= ~(1 << (channel - 1))
+
+        starting = {}
+        for item in incoming:
+            if not item or item[0] != "pulse":
+                continue
+            _, channel, seconds, cooldown, test = item
+            if (aborting or channel in self.active or channel in starting or self.duty.get(channel, (0,))[0]
+                    or now < self.ready_at.get(channel, 0.0)):
+                self.pulse_dropped.emit(channel, test)
+                continue
+            if channel in self.duty:
+                # Back from continuous dosing, full output for pulses again
+                if not self.transact("set_pwm", channel, 100):
+                    self.pulse_dropped.emit(channel, test)
+                    continue
+                del self.duty[channel]
+            starting[channel] = (seconds, cooldown, test)
+            mask |= 1 << (channel - 1)
+
+        if mask == self.mask and not ending:
+            return
+        if not self.transact("set_all", mask):
+            # Nothing changed, due off edges are retried on the next tick
+            print("Pump MOSFETs could not be switched!")
+            for channel, (seconds, cooldown, test) in starting.items():
+                self.pulse_dropped.emit(channel, test)
+            return
+        edge = time.monotonic()
+        self.mask = mask
+
+        for channel in ending:
+            deadline, start, commanded, cooldown, test = self.active.pop(channel)
+            self.ready_at[channel] = edge + cooldown
+            self.pulse_done.emit(Pulse(channel, commanded, edge - start, start, test))
+        for channel, (seconds, cooldown, test) in starting.items():
+            self.active[channel] = (edge + seconds, edge, seconds, cooldown, test)
+            self.pump_on.emit(channel, test)
+
+    def apply_duty(self, channel, duty):
+        percent = int(round(min(max(duty, 0.0), 1.0) * 100))
+        current = self.duty.get(channel)
+        if channel in self.active or (current is not None and current[0] == percent):
+            return
+        if current is None and not percent:
+            return
+        if not self.transact("set_pwm", channel, percent):
+            return
+        now = time.monotonic()
+        if current is not None:
+            self.end_segment(channel, current, now)
+        self.duty[channel] = (percent, now)
+        self.duty_changed.emit(channel, percent / 100)
+
+    def end_segment(self, channel, segment, now):
+        percent, since = segment
+        if percent:
+            length = now - since
+            self.pulse_done.emit(Pulse(channel, length, length * percent / 100, since, False, True))
+
+    def flush_segments(self):
+        now = time.monotonic()
+        for channel, segment in list(self.duty.items()):
+            if segment[0] and now - segment[1] >= self.segment_length:
+                self.end_segment(channel, segment, now)
+                self.duty[channel] = (segment[0], now)
+
+    def transact(self, action, *args):
+        """Call lib8mosind.<action>(stack, *args) under i2c_mutex, retrying on errors."""
+        for attempt in range(self.retry_count):
+            if attempt:
+                telemetry.record_retry("MOSFET")
+                time.sleep(self.retry_delay)
+            lock_i2c()
+            try:
+                start = time.monotonic()
+                getattr(self.mosfet, action)(self.stack, *args)
+                telemetry.record_transaction("MOSFET", time.monotonic() - start)
+                return True
+            except Exception as e:
+                print(f"Error during pump {action}{args}: {e}")
+                telemetry.record_error("MOSFET", action)
+            finally:
+                i2c_mutex.unlock()
+        return False
+
+    def stop(self):
+        self.is_running = False
+        self.requests.put(None)
+
+
+class PumpWatchdog(QObject):
+    """Checks every period seconds that the pumps do what PumpWorker commanded.
+
+    Faults are a pulse running past its off deadline by more than grace, a
+    pulse on longer than max_on_time, a PumpWorker that stopped ticking for
+    stall_timeout while a pump is on, and a MOSFET that reads back on while
+    it is commanded off (two checks in a row, so a write racing the check
+    is not counted). Any fault switches the whole board off straight away,
+    without waiting more than lock_timeout for i2c_mutex, so a pump is off
+    at most max_latency() after a missed edge. Every new fault is recorded
+    as a telemetry incident and sent through incident_signal.
+    """
+    incident_signal = pyqtSignal(str)
+
+    def __init__(self, pump, mosfet, stack=0, period=0.2, max_on_time=10.0):
+        super().__init__()
+        self.pump = pump
+        self.mosfet = mosfet
+        self.stack = stack
+        self.period = period
+        self.max_on_time = max_on_time
+        self.grace = 0.1
+        self.stall_timeout = 1.0
+        self.lock_timeout = 0.05
+        self.stray = 0          # Bits read back on while commanded off at the last check
+        self.reported = set()   # Faults already recorded, so a lasting one is recorded once
+        self.is_running = True
+
+    def max_latency(self):
+        # Worst case from a missed edge to the forced off write
+        return self.grace + 2 * self.period + 2 * self.lock_timeout
+
+    def run(self):
+        next_check = time.monotonic()
+        while self.is_running:
+            self.check()
+            next_check += self.period
+            delay = next_check - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_check = time.monotonic()
+
+    def check(self):
+        mask, pulses, pwm_mask, heartbeat = self.pump.published
+        now = time.monotonic()
+        faults = {}
+        for channel, start, deadline in pulses:
+            if now > deadline + self.grace:
+                faults[("missed", channel, start)] = f"pump {channel} missed its off edge by {now - deadline:.2f} s"
+            elif now - start > self.max_on_time:
+                faults[("on time", channel, start)] = f"pump {channel} on for more than {self.max_on_time:g} s"
+        if (mask or pwm_mask) and now - heartbeat > self.stall_timeout:
+            faults[("stalled", heartbeat)] = f"pump thread stalled for {now - heartbeat:.1f} s with a pump on"
+
+        readback = self.readback()
+        if readback is not None:
+            stray = readback & ~(mask | pwm_mask) & 0xFF
+            if stray & self.stray:
+                faults[("readback", stray & self.stray)] = (f"MOSFET mask {stray & self.stray:#04x} on while "
+                                                           f"commanded off (readback {readback:#04x})")
+            self.stray = stray
+
+        if faults:
+            self.force_off(pwm_mask)
+            for key, text in faults.items():
+                if key not in self.reported:
+                    self.reported.add(key)
+                    print(f"Pump watchdog: {text}")
+                    telemetry.record_incident("MOSFET", text)
+                    self.incident_signal.emit(text)
+
+    def readback(self):
+        if not i2c_mutex.tryLock(int(self.lock_timeout * 1000)):
+            telemetry.record_busy("MOSFET")
+            return None
+        try:
+            start = time.monotonic()
+            value = self.mosfet.get_all(self.stack)
+            telemetry.record_transaction("MOSFET", time.monotonic() - start)
+            return value
+        except Exception as e:
+            print(f"Pump watchdog readback failed: {e}")
+            telemetry.record_error("MOSFET", "watchdog readback")
+            return None
+        finally:
+            i2c_mutex.unlock()
+
+    def force_off(self, pwm_mask):
+        # The kernel serializes transfers on the adapter, so go ahead without the mutex if need be
+        locked = i2c_mutex.tryLock(int(self.lock_timeout * 1000))
+        try:
+            self.mosfet.set_all(self.stack, 0)
+            for channel in range(1, 9):
+                if pwm_mask & (1 << (channel - 1)):
+                    self.mosfet.set_pwm(self.stack, channel, 0)
+        except Exception as e:
+            print(f"Pump watchdog could not switch the pumps off: {e}")
+            telemetry.record_error("MOSFET", "watchdog off")
+        finally:
+            if locked:
+                i2c_mutex.unlock()
+        # Bring PumpWorker in line with the board
+        self.pump.abort()
+
+    def stop(self):
+        self.is_running = False
+
+
 class USBWorker(QObject):
     update_usb = pyqtSignal(bool, object)
     
@@ -259,6 +782,8 @@ class USBWorker(QObject):
         self.is_running = False
     
     def monitor_usb(self):
+        if Context is None:
+            return
         context = Context()
         data = []
         for device in context.list_devices(subsystem='block', DEVTYPE='partition'):
@@ -9,34 +9,45 @@ if 'XDG_RUNTIME_DIR' not in os.environ:
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QGridLayout, 
                              QLabel, QMenuBar, QAction, QStatusBar, 
                              QComboBox, QDoubleSpinBox, QHBoxLayout, QVBoxLayout, 
-                             QPushButton, QTabWidget, QFrame, QMenu, QMessageBox, QActionGroup, QDial, QToolTip, QCheckBox, QSizePolicy, QToolButton)
+                             QPushButton, QTabWidget, QFrame, QMenu, QMessageBox, QActionGroup, QDial, QToolTip, QCheckBox, QSizePolicy, QToolButton, QFileDialog)
 from PyQt5.QtGui import QFont, QColor, QIcon, QPen, QTransform, QPalette
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QMetaObject, pyqtSlot, QTimer, QMutex, QSize, QPoint
 from scripts.LedIndicatorWidget import LedIndicator
-from scripts.pHStat_worker import pHWorker, RTDWorker, StatWorker, USBWorker, i2c_mutex
+from scripts.pHStat_worker import (BusWorker, StatWorker, PumpWorker, PumpWatchdog, USBWorker, i2c_mutex, lock_i2c,
+                                   DOSING_PULSE, DOSING_PWM)
+from scripts.pHStat_telemetry import telemetry
+from scripts.atlas import EZOError, EZO_SUCCESS, EZO_PENDING
 from scripts.PPSWorker import PPSWorker
-from scripts.pHstat_config import ConfigReader, ConfigWriter
-from scripts.pHStat_classes import (pHPickerDialog, SelectPickerDialog, pumpControl, 
+from scripts.pHstat_config import ConfigReader, ConfigWriter, ProbeReader, PumpCurveReader
+from scripts.pHStat_classes import (pHPickerDialog, SelectPickerDialog, 
                             DatePickerDialog, CustomTextWidget, ClickableLabel, CalibratePumpDialog,CalibratepHDialog, 
-                            monoTimer, ToggleSwitch, PHSelectorWidget)
+                            monoTimer, ToggleSwitch, PHSelectorWidget, DiagnosticsDialog)
 import pyqtgraph as pg
 #from pyqtgraph.Qt import QtGui, QtWidgets
 #import numpy as np
-from scripts.pHStat_csv import create_csv, log_csv, read_log_data, scale_time_data
+from scripts.pHStat_csv import (create_csv, log_csv, log_wide_csv, log_event, scale_time_data, CSVWriter, export_store_csv,
+                               LOG_CACHE_SUFFIX)
+from scripts.pHStat_csv import load_session, get_correct_path
+from scripts.pHStat_journal import recover_session, write_session, read_session, close_session, latest_session
+from scripts.pHStat_buffer import ChannelBuffer
+from scripts.pHStat_ledger import DoseLedger, PumpCurve
+from scripts.pHStat_recipe import RecipeRunner, load_recipe
+from scripts.pHStat_sim import TitrationPlant, SimEZO, SimMosInd, SimPPS
+from scripts.pHStat_control import make_controller, MODE_BANGBANG, MODE_PID, MODE_MODEL
 #from scripts.atlas import atlas_i2c
 import datetime
 import shutil
 import re
-import lib8mosind
 #from scripts.pHStat_classes import MockLib8MosInd
-import serial.tools.list_ports
-from voltcraft.pps import PPS
 from scripts import PlotManager, atlas_i2c, Fusion3DToggle, RoundSetButton, Push3DButton, Round3DButton, PowerLogger
 
 
 #lib8mosind = MockLib8MosInd()
 
 def find_voltcraft_pps() -> str or None:
+    # Imported here so --sim runs without the serial and voltcraft packages
+    import serial.tools.list_ports
+    from voltcraft.pps import PPS
     ports = serial.tools.list_ports.comports()
 
     for port in ports:
@@ -78,10 +89,18 @@ def scale_graph_fonts(widget, label_size, tick_size):
 
 class MainWindow(QMainWindow):
     startProcessingSignal = pyqtSignal()
+    selectChangedSignal = pyqtSignal(int)
+    pHSelectChangedSignal = pyqtSignal(float)
+    controllerChangedSignal = pyqtSignal(object, float)
+    dosingChangedSignal = pyqtSignal(str)
+    adaptiveCooldownSignal = pyqtSignal(bool)
+    restoreStateSignal = pyqtSignal(object)
     
-    def __init__(self):
+    def __init__(self, simulate=False, sim_speed=1.0):
         super(MainWindow, self).__init__()
 
+        # With simulate every device talks to a TitrationPlant instead of the hardware
+        self.plant = TitrationPlant(speed=sim_speed) if simulate else None
         self.setupVariables()
 
         #self.pH_settings_window = pHPickerDialog(float(self.pHSelect))
@@ -98,17 +117,13 @@ class MainWindow(QMainWindow):
         self.pH_calibrate_window = CalibratepHDialog(float(self.lowpH), float(self.midpH), float(self.highpH))
         self.pH_calibrate_window.calibrate_changed.connect(self.handle_calibrate)
         
-        self.pump_control = pumpControl(self)
-        self.pump_control.pumpActivated.connect(self.pump_activated)
-        self.pump_control.pumpDeactivated.connect(self.pump_deactivated)
-        
         self.initializeUI()
         #self.delayed_show_fullscreen()
 
     def initializeUI(self):
         
         """Initialize the window and display its contents to the screen."""
-        self.setWindowTitle('pHStat Qt.Mosfet V1.2')
+        self.setWindowTitle('pHStat Qt.Mosfet V1.2' + (' (simulation)' if self.plant else ''))
         self.setWindowFlags(self.windowFlags() | Qt.WindowTitleHint)
 
         self.setWindowIcon(QIcon('path/to/your/app/icon.png'))  # Set the window icon
@@ -118,9 +133,10 @@ class MainWindow(QMainWindow):
         self.setupWidgets()
         self.setupStatusBar()
 
-        self.setuppHWorker()
-        self.setupRTDWorker()
+        self.setupBusWorker()
         self.setupStatWorker()
+        self.setupPumpWorker()
+        self.setupCSVWriter()
         self.setupUSBWorker()
         self.setupPPSWorker()
         
@@ -133,6 +149,7 @@ class MainWindow(QMainWindow):
         self.toggle_pH_control.trigger()
 
         self.show()
+        QTimer.singleShot(0, self.recoverSession)
 
     def resizeEvent(self, event):
         super().resizeEvent(event)
@@ -307,18 +324,17 @@ class MainWindow(QMainWindow):
         self.tabWidget.setStyleSheet(tab_style)
         
     def setupVariables(self):
-        self.pump_start_time = None  # Initialize a variable to store the start time
         self.elapsed_time = None
         self.totalml = 0
+        self.coulombs = 0.0
+        self.doseLedger = None  # Open while a run is logging
+        self.sessionStore = None  # Binary log of the session, open while a run is logging
+        self.resumeState = None   # Checkpoint of a run to pick up with the next start
+        self.stoppedAt = None     # (elapsed, time.time()) when the run in Log_file was last stopped
+        self.recipe = None        # Loaded recipe, runs with the next start
+        self.recipeRunner = None
         self.pH_label = []
-        self.send_counter = time.time()
-        self.read = False
-        self.test_time = time.time()
-        self.pHdata = 9.9
         self.temp = 20
-        #self.dev = 1#atlas_i2c(address=address)
-        self.pHdev = atlas_i2c(address=99)
-        self.RTDdev = atlas_i2c(address=102)
         #self.log_interval = 0
         self.Ref_path = ''
         self.pHSelect = 0.0
@@ -329,12 +345,31 @@ class MainWindow(QMainWindow):
         #self.pHvalue = 0
         #self.RTDvalue = 0
         self.valueData = [0,0,0,0,0,0]
+        self.loggedSeq = [0,0,0,0,0,0]  # channelBuffers[i].total at the last log tick
         self.cooldown = 0
         self.currentActiveTabIndex = 0  # Track the current tab index
         self.graphTabs = []
         self.graphWidgets = []
         self.plotindex = ["Pump", "pH" , "RTD", "Volt", "Amp", "Coulomb"]
         self.headerindex = ["Pumped (ml)", "pH", "Temperature (°C)", "Voltage (V)", "Current (A)", "Coulomb (C)"]
+        # In-memory history of the running experiment per channel, shared by plots and the log tick
+        self.channelBuffers = [ChannelBuffer() for _ in self.plotindex]
+        # EZO probes from settings.ini. The ones with a channel feed the pH/RTD
+        # displays, any others are shown in the status bar.
+        self.probes = ProbeReader()
+        for probe in self.probes:
+            if self.plant is not None:
+                probe["dev"] = SimEZO(self.plant, probe["address"], probe["kind"])
+            else:
+                probe["dev"] = atlas_i2c(address=probe["address"], bus=probe["bus"])
+            probe["channel"] = self.plotindex.index(probe["channel"]) if probe["channel"] in ("pH", "RTD") else None
+        self.pHdev = next((probe["dev"] for probe in self.probes if probe["channel"] == 1), None)
+        self.probeValues = {}
+        if self.plant is not None:
+            self.mosfet = SimMosInd(self.plant)
+        else:
+            import lib8mosind  # Only needed on the real hardware
+            self.mosfet = lib8mosind
         self.Log_file = ["","","","","",""]
         self.Log_date = [0,0,0,0,0,0]
         self.is_logging = False
@@ -360,6 +395,11 @@ class MainWindow(QMainWindow):
         setting_menu = menu_bar.addMenu('Settings')
         
         # Create actions for file_menu
+        self.open_session_action = QAction('Open session...', self)
+        self.open_session_action.setStatusTip("Show the logs of a past run in the graphs")
+        self.open_session_action.triggered.connect(self.openSession)
+        file_menu.addAction(self.open_session_action)
+
         self.exit_action = QAction('Exit', self)
         self.exit_action.triggered.connect(self.close)  # Connect the triggered signal to the close method
         self.exit_action.setStatusTip("Exit the program")
@@ -376,6 +416,11 @@ class MainWindow(QMainWindow):
         self.reconnect_pps_action.triggered.connect(self.reconnectPPS)
         setting_menu.addAction(self.reconnect_pps_action)
 
+        self.diagnostics_action = QAction('I2C diagnostics', self)
+        self.diagnostics_action.setStatusTip("Show bus latency, errors and retries per device")
+        self.diagnostics_action.triggered.connect(self.openDiagnosticsWindow)
+        setting_menu.addAction(self.diagnostics_action)
+
         
         
         # In setupMenu()
@@ -434,6 +479,62 @@ class MainWindow(QMainWindow):
         
         # Add the submenu to the settings menu
         pHstatMenu.addMenu(log_options_submenu)
+
+        controller_submenu = QMenu("Controller", self)
+        controller_group = QActionGroup(self)
+        controller_group.setExclusive(True)
+        for label, mode in (("Bang-bang (fixed pulse)", MODE_BANGBANG),
+                            ("PID", MODE_PID),
+                            ("Model-based", MODE_MODEL)):
+            action = QAction(label, self)
+            action.setCheckable(True)
+            action.setData(mode)
+            action.setChecked(mode == self.controllerMode)
+            action.triggered.connect(self.controller_selected)
+            controller_group.addAction(action)
+            controller_submenu.addAction(action)
+        pHstatMenu.addMenu(controller_submenu)
+
+        dosing_submenu = QMenu("Dosing", self)
+        dosing_group = QActionGroup(self)
+        dosing_group.setExclusive(True)
+        for label, dosing in (("Pulses", DOSING_PULSE),
+                              ("Continuous (PWM)", DOSING_PWM)):
+            action = QAction(label, self)
+            action.setCheckable(True)
+            action.setData(dosing)
+            action.setChecked(dosing == self.dosing)
+            action.triggered.connect(self.dosing_selected)
+            dosing_group.addAction(action)
+            dosing_submenu.addAction(action)
+        pHstatMenu.addMenu(dosing_submenu)
+
+        loadRecipe = QAction('Load recipe...', self)
+        loadRecipe.setStatusTip("Load a timed program of setpoint, mode and PPS changes, it runs with the next start")
+        loadRecipe.triggered.connect(self.openRecipe)
+        pHstatMenu.addAction(loadRecipe)
+        self.stopRecipeAction = QAction('Stop recipe', self)
+        self.stopRecipeAction.setEnabled(False)
+        self.stopRecipeAction.triggered.connect(self.stopRecipe)
+        pHstatMenu.addAction(self.stopRecipeAction)
+
+        self.adaptiveCooldownAction = QAction("Adaptive cooldown", self, checkable=True)
+        self.adaptiveCooldownAction.setChecked(self.adaptiveCooldown)
+        self.adaptiveCooldownAction.setStatusTip("Wait as long as the pH takes to respond to a dose instead of the fixed cooldown")
+        self.adaptiveCooldownAction.toggled.connect(self.adaptive_cooldown_toggled)
+        pHstatMenu.addAction(self.adaptiveCooldownAction)
+
+        self.wideLogAction = QAction("Wide session log", self, checkable=True)
+        self.wideLogAction.setChecked(self.wideLog)
+        self.wideLogAction.setStatusTip("Log all channels in one Session file with pump events apart, from the next new session")
+        self.wideLogAction.toggled.connect(self.wide_log_toggled)
+        pHstatMenu.addAction(self.wideLogAction)
+
+        self.binaryLogAction = QAction("Binary session store", self, checkable=True)
+        self.binaryLogAction.setChecked(self.binaryLog)
+        self.binaryLogAction.setStatusTip("Log to a binary store, the CSV files are written on USB copy, from the next new session")
+        self.binaryLogAction.toggled.connect(self.binary_log_toggled)
+        pHstatMenu.addAction(self.binaryLogAction)
         
         # Optional: connect to a method
         self.option1.triggered.connect(self.option_selected)
@@ -500,13 +601,15 @@ class MainWindow(QMainWindow):
             try:
                 # Connect signals
                 self.startProcessingSignal.connect(self.StatWorker.start_processing)
-                self.pHWorker.update_signal_pH.connect(self.StatWorker.update_pH)
+                for worker in self.busWorkers:
+                    worker.update_signal.connect(self.StatWorker.update_pH)
                 #self.pH_settings_window.select_changed.connect(self.StatWorker.update_pH_select)
                 
                 #self.select_settings_window.select_changed.connect(self.StatWorker.update_select)
                 
                 self.StatWorker.status_signal.connect(self.handle_Stat)
-                self.StatWorker.pump_signal.connect(self.pumpInput)
+                self.StatWorker.dose_signal.connect(self.pumpDose)
+                self.StatWorker.duty_signal.connect(self.pumpDuty)
                 # Update labels
                 self.pHstatLabel.setDisabled(False)
                 self.pHstatLabel.updateText("Active")
@@ -531,10 +634,12 @@ class MainWindow(QMainWindow):
             try:
                 #Disconnect signals
                 self.startProcessingSignal.disconnect(self.StatWorker.start_processing)
-                self.pHWorker.update_signal_pH.disconnect(self.StatWorker.update_pH)
+                for worker in self.busWorkers:
+                    worker.update_signal.disconnect(self.StatWorker.update_pH)
                 #self.select_settings_window.select_changed.disconnect(self.StatWorker.update_select)
                 self.StatWorker.status_signal.disconnect(self.handle_Stat)
-                self.StatWorker.pump_signal.disconnect(self.pumpInput)
+                self.StatWorker.dose_signal.disconnect(self.pumpDose)
+                self.StatWorker.duty_signal.disconnect(self.pumpDuty)
                 #Update labels
                 self.pHstatLabel.setDisabled(True)
                 self.pHstatLabel.updateText("Inactive")
@@ -551,14 +656,7 @@ class MainWindow(QMainWindow):
                 print(f"Disconnect error (probably already disconnected): {e}")
 
             # Extra: If pump is running, deactivate it immediately
-            self.pump_deactivated(test=False)
-
-            # Also stop the StatWorker if needed
-            try:
-                self.StatWorker.stop()
-                print("StatWorker stopped.")
-            except Exception as e:
-                print(f"Error stopping StatWorker: {e}")
+            self.PumpWorker.abort()
             # Manage the graph tabs (disable Pump plot, focus on pH+Temp plot)
             pump_index = self.tabWidget.indexOf(self.graphTabs[0])
             if pump_index != -1:
@@ -577,6 +675,59 @@ class MainWindow(QMainWindow):
             self.logtimer.start(int(self.log_interval))
             #print(f"Log timer interval updated to {self.log_interval} ms")
 
+    def adaptive_cooldown_toggled(self, checked):
+        self.adaptiveCooldown = checked
+        ConfigWriter(self)
+        self.adaptiveCooldownSignal.emit(checked)
+
+    def wide_log_toggled(self, checked):
+        # A running session keeps the format it was created with
+        if self.Log_file[0]:
+            self.wideLogAction.setChecked(self.wideLog)
+            self.statusBar().showMessage("Reset the session to change the log format", 5000)
+            return
+        self.wideLog = checked
+        ConfigWriter(self)
+
+    def binary_log_toggled(self, checked):
+        if self.Log_file[0]:
+            self.binaryLogAction.setChecked(self.binaryLog)
+            self.statusBar().showMessage("Reset the session to change the log format", 5000)
+            return
+        self.binaryLog = checked
+        ConfigWriter(self)
+
+    @pyqtSlot(float, float, float)
+    def cooldown_estimated(self, delay, tau, cooldown):
+        print(f"pH response: delay {delay:.1f} s, tau {tau:.1f} s, cooldown {cooldown:.1f} s")
+        if self.adaptiveCooldown:
+            self.statusBar().showMessage(f"Cooldown {cooldown:.1f} s (response delay {delay:.1f} s, tau {tau:.1f} s)", 10000)
+
+    def dosing_selected(self):
+        action = self.sender()
+        if action and action.isChecked():
+            self.dosing = action.data()
+            ConfigWriter(self)
+            self.dosingChangedSignal.emit(self.dosing)
+
+    def controller_selected(self):
+        action = self.sender()
+        if action and action.isChecked():
+            self.controllerMode = action.data()
+            ConfigWriter(self)
+            self.updateController()
+
+    def makeControllers(self):
+        # One per pumping direction: 1 raises the pH, -1 lowers it
+        return {direction: make_controller(self.controllerMode, float(self.addtime),
+                                           float(self.kp), float(self.ki), float(self.kd),
+                                           float(self.mindose), float(self.maxdose))
+                for direction in (1, -1)}
+
+    def updateController(self):
+        # Fresh controllers, so PID integral and learned gain start over
+        self.controllerChangedSignal.emit(self.makeControllers(), float(self.cooldown))
+
     def setupWidgets(self):
         """Setup widgets and layouts here."""
         central_widget = QWidget()  # Create a central widget
@@ -736,7 +887,7 @@ class MainWindow(QMainWindow):
         pHselectLayout = QGridLayout(pHselectWidget)
         
         self.keepSelector = QComboBox()
-        self.keepSelector.addItems(["Keep Above", "Keep Below"])
+        self.keepSelector.addItems(["Keep Above", "Keep Below", "Keep At"])
         self.keepSelector.currentIndexChanged.connect(self.keep_selector_changed)
 
         #self.layerSelector.currentIndexChanged.connect(self.apply_layer_flag)
@@ -870,18 +1021,13 @@ class MainWindow(QMainWindow):
         #self.handle_pHselect(float(self.pHSelect))
     
     def keep_selector_changed(self, index):
-        try:
-            self.StatWorker.update_select(index)
-        except Exception:
-            pass   
+        # Queued to the StatWorker thread, which re-evaluates straight away
+        self.selectChangedSignal.emit(index)
         self.handle_select(index)
 
     def pH_selector_changed(self, value):
         pH_select = round(value,1)
-        try:
-            self.StatWorker.update_pH_select(pH_select)
-        except Exception:
-            pass
+        self.pHSelectChangedSignal.emit(pH_select)
         self.handle_pH(pH_select)        
     
     def force_power_off(self):
@@ -992,6 +1138,8 @@ class MainWindow(QMainWindow):
         amps = getattr(self, 'latest_current', 0)
         self.coulombs += amps * dt
         self.update_gui(self.coulombs,5)
+        if self.recipeRunner is not None:
+            self.recipeRunner.update_coulombs(self.coulombs)
         #print(f"Coulombs: {self.coulombs:.2f}")
         #self.coulombLabel.setText(f"Coulombs: {self.coulombs:.2f}")
 
@@ -1014,34 +1162,44 @@ class MainWindow(QMainWindow):
         self.CalcWorker.timeout.connect(self.CalcWorkerRead)
     
     def CalcWorkerRead(self):
+        # One read per call, a busy probe or a failed read is tried again by
+        # restarting the timer so the mutex is never held while waiting
         retry_count = 5 # Number of times to retry
-        retry_delay = 0.01 # Delay between retries in second
-        success = False # Flag indicating succes
-        
-        for attempt in range(retry_count):
-            
-            try:
-                i2c_mutex.lock()
-                pHdata = self.pHdev.read()   
-                success = True
-                break # Exit the function if succesvol
-            except Exception as e:
-                print(f"Error during read: {e}")
-                pass
-            finally:
-                try:
-                    i2c_mutex.unlock()
-                    print(f"Main unlocking i2c_mutex after attempt {attempt + 1}")
-                except Exception as unlock_error:
-                    print(f"Error unlocking i2c_mutex: {unlock_error}")
-                if not success:
-                    time.sleep(retry_delay)	# Wait before retrying
-                
+        status = None
+        try:
+            lock_i2c()
+            start = time.monotonic()
+            status, payload = self.pHdev.read_response()
+            telemetry.record_transaction("pH calibration", time.monotonic() - start)
+        except Exception as e:
+            print(f"Error during read: {e}")
+            telemetry.record_error("pH calibration", "read")
+        finally:
+            i2c_mutex.unlock()
+
+        if status is None and self.calcAttempt + 1 < retry_count:
+            self.calcAttempt += 1
+            telemetry.record_retry("pH calibration")
+            self.CalcWorker.start(int(self.pHdev.min_poll * 1000))
+            return
+        if status == EZO_PENDING and time.monotonic() < self.calcDeadline:
+            telemetry.record_busy("pH calibration")
+            self.CalcWorker.start(int(self.calcPoll * 1000))
+            self.calcPoll = min(self.calcPoll * 2, self.pHdev.max_poll)
+            return
+        if status == EZO_SUCCESS:
+            pHdata = payload
+        else:
+            if status is not None:
+                print(f"Error during read: {EZOError(status)}")
+                telemetry.record_error("pH calibration", f"status {status}")
+            pHdata = "N/A"
         self.pH_calibrate_window.updateInfo(f'{pHdata}')
 
 
     def WorkerTimerFinished(self):
-        self.pHWorker.resume()
+        for worker in self.busWorkers:
+            worker.resume(self.pHdev)
     
     def initTimer(self):
         # Timer setup
@@ -1056,6 +1214,25 @@ class MainWindow(QMainWindow):
         
         self.coulombClock = monoTimer()
 
+        # Periodic dump of the I2C telemetry into the session folder
+        self.telemetryTimer = QTimer(self)
+        self.telemetryTimer.setInterval(60000)
+        self.telemetryTimer.timeout.connect(self.dumpTelemetry)
+        self.telemetryTimer.start()
+
+        # Checkpoint of the run, so a restart can carry on where it was
+        self.checkpointTimer = QTimer(self)
+        self.checkpointTimer.setInterval(int(float(self.checkpointinterval) * 1000))
+        self.checkpointTimer.timeout.connect(self.checkpoint)
+
+    def dumpTelemetry(self):
+        if not self.Log_file[0]:
+            return
+        try:
+            telemetry.dump(os.path.dirname(self.Log_file[0]))
+        except OSError as e:
+            print(f"Error writing telemetry: {e}")
+
     def startTimer(self):
         self.logtimer.start()  # Start the timer
 
@@ -1063,39 +1240,97 @@ class MainWindow(QMainWindow):
         self.logtimer.stop()  # Stop the timer
 
     def timerFunction(self):
-       
-        for i in range(5):
-            log_csv(self, self.valueData[i+1], i+1, self.headerindex[i+1])
+        row = [self.channelBuffers[0].last()]
+        for i in range(1, 6):
+            buffer = self.channelBuffers[i]
+            # Skip channels without a new value since the last tick (e.g. a probe that stopped answering)
+            if buffer.total == self.loggedSeq[i]:
+                row.append(None)
+                continue
+            self.loggedSeq[i] = buffer.total
+            row.append(buffer.last())
+            if not self.wideLog and self.sessionStore is None:
+                log_csv(self, buffer.last(), i, self.headerindex[i])
+        if any(value is not None for value in row[1:]):
+            if self.sessionStore is not None:
+                # The pump column only gets a value when a pulse is done
+                self.sessionStore.append(self.logging_timer.elapsed(), [None] + row[1:])
+            elif self.wideLog:
+                log_wide_csv(self, row)
+
+    def record(self, index, value):
+        # History uses the same time base as the log files, so only while running
+        if self.logging_timer.running:
+            self.channelBuffers[index].append(self.logging_timer.elapsed(), value)
    
     def start_pHStat(self):
+        session_open = bool(self.Log_file[0])
         create_csv(self, self.valueData, self.plotindex, self.headerindex)
+        # Every pump pulse of the run, next to the Pump log
+        self.doseLedger = DoseLedger(os.path.splitext(self.Log_file[0])[0] + "_ledger.bin", self.pumpCurves())
+        self.totalml = self.doseLedger.total()
+        resume, self.resumeState = self.resumeState, None
         mode = "CC" if self.modeToggle.isChecked() else "CV"
         ouput = "ON" if self.powerButton.isChecked() else "OFF"
         if  hasattr(self, 'ppsWorker'):
             self.logger.log_start(self.voltageDial.value()/10, self.currentDial.value()/10, mode, ouput, self.PStype)
         self.logtimer.start()  # Start the timer
-        self.coulombs = 0.0
+        self.coulombs = resume["coulombs"] if resume else 0.0
         self.coulombClock.start()
         self.coulombTimer.start()
-        self.logging_timer.start()
+        # A resumed or restarted run counts on from where it stopped, including the
+        # time it was down, so the reaction time keeps rising within a session
+        if resume:
+            self.logging_timer.start(resume["elapsed"] + max(time.time() - resume["saved"], 0.0))
+        elif session_open and self.stoppedAt is not None:
+            self.logging_timer.start(self.stoppedAt[0] + max(time.time() - self.stoppedAt[1], 0.0))
+        else:
+            self.logging_timer.start()
+        self.stoppedAt = None
+        for i, buffer in enumerate(self.channelBuffers):
+            buffer.clear()
+            self.loggedSeq[i] = 0
+        if resume:
+            self.reloadHistory()
+        for i in range(len(self.channelBuffers)):
+            self.record(i, self.totalml if i == 0 else self.valueData[i])
         self.pHstatLabel.setEnabled(True)
         self.pumpLabel.setEnabled(True)
         self.trigger_processing()
+        if resume and resume.get("controllerMode") == self.controllerMode:
+            # Queued after start_processing, which resets the controllers
+            self.restoreStateSignal.emit(resume["controller"])
         self.startbutton.setEnabled(False)
         self.stopbutton.setEnabled(True)
         self.start = True
+        if resume and resume.get("recipe"):
+            self.resumeRecipe(resume)
+        elif self.recipe is not None:
+            self.startRecipe()
+        self.checkpoint()
+        self.checkpointTimer.start()
 
     def stop_pHStat(self):
+        self.stopRecipe()
         self.logtimer.stop()  # stop the timer
+        self.csvWriter.flush()
         self.coulombTimer.stop()
         self.coulombClock.stop()
-        self.logging_timer.stop()
+        self.stoppedAt = (self.logging_timer.stop(), time.time())
+        self.checkpointTimer.stop()
+        self.checkpoint()
         self.trigger_processing()
         self.startbutton.setEnabled(True)
         self.resetbutton.setEnabled(True)
         self.pHstatLabel.setEnabled(False)
         self.pumpLabel.setEnabled(False)
         self.totalml = 0
+        if self.doseLedger is not None:
+            self.doseLedger.close()
+            self.doseLedger = None
+        if self.sessionStore is not None:
+            self.sessionStore.close()
+            self.sessionStore = None
         if  hasattr(self, 'ppsWorker'):
             if self.start: self.logger.log_change("Pressed","STOP") 
             else: pass
@@ -1103,6 +1338,207 @@ class MainWindow(QMainWindow):
             self.logger.log_stop(self.voltageDial.value()/10, self.currentDial.value()/10, self.coulombs)
 
             
+    def sessionState(self):
+        # What is needed to continue this session after a restart
+        return {"Log_file": self.Log_file, "Log_date": self.Log_date,
+                "wideLog": self.wideLog, "binaryLog": self.binaryLog,
+                "saved": time.time(),
+                "running": self.logging_timer.running,
+                # The timer reads 0 once stopped, a stopped run keeps the time it reached
+                "elapsed": self.logging_timer.elapsed() if self.logging_timer.running
+                           else (self.stoppedAt[0] if self.stoppedAt else 0.0),
+                "totalml": self.totalml,
+                "injections": self.valueData[0],
+                "coulombs": self.coulombs,
+                "pHSelect": float(self.pHSelect),
+                "select": int(self.Select),
+                "controllerMode": self.controllerMode,
+                "controller": self.StatWorker.controller_state(),
+                "recipe": {"path": self.recipe["path"], "elapsed": self.recipeRunner.elapsed()}
+                          if self.recipeRunner is not None and self.recipeRunner.is_running else None}
+
+    def checkpoint(self):
+        # Every checkpointinterval seconds and after every dose, replaced atomically
+        if not self.Log_file[0]:
+            return
+        try:
+            write_session(os.path.dirname(self.Log_file[0]), self.sessionState())
+        except OSError as e:
+            print(f"Error writing checkpoint: {e}")
+
+    def reloadHistory(self):
+        # The graphs of a resumed run start with what was logged before the restart
+        self.csvWriter.flush(wait=True)
+        try:
+            channels = load_session(os.path.dirname(self.Log_file[0]), self.plotindex, self.headerindex)
+        except (OSError, ValueError) as e:
+            print(f"Error loading the history of the session: {e}")
+            return
+        for labels, buffer in zip(self.plotindex, self.channelBuffers):
+            if labels in channels:
+                buffer.extend(*channels[labels])
+
+    def recoverSession(self):
+        # A session that was not reset before the program ended (e.g. a power cut) can be continued
+        folder = latest_session(get_correct_path('Desktop/Data'))
+        if folder is None:
+            return
+        for name, lost in recover_session(folder).items():
+            print(f"Dropped a torn tail of {lost} bytes from {name}")
+        try:
+            state = read_session(folder)
+        except (OSError, ValueError) as e:
+            print(f"Error reading the session in {folder}: {e}")
+            return
+        reply = QMessageBox.question(self, 'Continue session?',
+                                     f"The session in {folder} was not finished.\nContinue logging into it?",
+                                     QMessageBox.Yes | QMessageBox.No,
+                                     QMessageBox.Yes)
+        if reply != QMessageBox.Yes:
+            close_session(folder)
+            return
+        self.continueSession(state)
+        if not self.start:
+            self.statusBar().showMessage(f"Continuing the session in {folder}, press Start to log into it")
+
+    def continueSession(self, state):
+        # The log format goes with the files, so it comes from the session and not settings.ini
+        self.wideLog = state.get("wideLog", False)
+        self.binaryLog = state.get("binaryLog", False)
+        for action, checked in ((self.wideLogAction, self.wideLog), (self.binaryLogAction, self.binaryLog)):
+            action.blockSignals(True)
+            action.setChecked(checked)
+            action.blockSignals(False)
+        self.Log_file = list(state["Log_file"])
+        self.Log_date = list(state["Log_date"])
+        self.resetbutton.setEnabled(True)
+        if "pHSelect" in state:
+            self.keepSelector.setCurrentIndex(state["select"])
+            self.pHSelectChangedSignal.emit(state["pHSelect"])
+            self.phSpin.blockSignals(True)
+            self.handle_pH(state["pHSelect"])
+            self.phSpin.blockSignals(False)
+            self.valueData[0] = state["injections"]
+        if state.get("running"):
+            # It was running when the program ended, carry on straight away
+            self.resumeState = state
+            self.start_pHStat()
+        else:
+            # Stopped before the program ended, the next start counts on from there
+            self.stoppedAt = (state.get("elapsed", 0.0), state.get("saved", time.time()))
+
+    def openSession(self):
+        if self.logging_timer.running:
+            QMessageBox.information(self, "Open session", "Stop the pH-stat before opening a past run.")
+            return
+        folder = QFileDialog.getExistingDirectory(self, "Open session", str(get_correct_path('Desktop/Data')))
+        if not folder:
+            return
+        try:
+            channels = load_session(folder, self.plotindex, self.headerindex)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Open session", f"Could not load {folder}:\n{e}")
+            return
+        if not channels:
+            self.statusBar().showMessage(f"No logs found in {folder}", 5000)
+            return
+        # The graphs draw from the channel buffers, the next start clears them again
+        for labels, buffer in zip(self.plotindex, self.channelBuffers):
+            buffer.clear()
+            if labels in channels:
+                buffer.extend(*channels[labels])
+        self.statusBar().showMessage(f"Showing the run in {folder}")
+
+    def openRecipe(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Load recipe", "", "Recipes (*.json)")
+        if not path:
+            return
+        try:
+            self.recipe = load_recipe(path)
+        except Exception as e:
+            QMessageBox.warning(self, "Recipe", f"Could not load {os.path.basename(path)}:\n{e}")
+            return
+        self.statusBar().showMessage(f"Recipe {self.recipe['name'] or os.path.basename(path)} "
+                                     f"loaded ({len(self.recipe['steps'])} steps), it runs with the next start")
+
+    def startRecipe(self, start=None):
+        # Journal and a copy of the recipe go next to the logs of the run
+        base = os.path.splitext(self.Log_file[0])[0]
+        if os.path.abspath(self.recipe["path"]) != os.path.abspath(base + "_recipe.json"):
+            try:
+                shutil.copy(self.recipe["path"], base + "_recipe.json")
+            except OSError as e:
+                # The recipe was read at loading, the copy is only for the record
+                print(f"Error copying the recipe: {e}")
+        self.recipeThread = QThread()
+        self.recipeRunner = RecipeRunner(self.recipe, float(self.pHSelect), base + "_recipe.log", start)
+        self.recipeRunner.moveToThread(self.recipeThread)
+        self.recipeRunner.setpoint_signal.connect(self.recipe_setpoint)
+        self.recipeRunner.select_signal.connect(self.keepSelector.setCurrentIndex)
+        self.recipeRunner.pps_signal.connect(self.recipe_pps)
+        self.recipeRunner.stop_signal.connect(self.stop_pHStat)
+        self.recipeRunner.step_signal.connect(self.recipe_step)
+        self.recipeRunner.finished.connect(self.recipeThread.quit)
+        self.recipeThread.started.connect(self.recipeRunner.run)
+        self.recipeThread.start()
+        self.stopRecipeAction.setEnabled(True)
+
+    def resumeRecipe(self, resume):
+        # The recipe of a resumed run goes on where it was, from the copy next to the logs if it is there
+        state = resume["recipe"]
+        for path in (os.path.splitext(self.Log_file[0])[0] + "_recipe.json", state["path"]):
+            try:
+                self.recipe = load_recipe(path)
+                break
+            except Exception as e:
+                print(f"Error loading the recipe {path}: {e}")
+        else:
+            return
+        elapsed = state["elapsed"] + max(time.time() - resume["saved"], 0.0)
+        self.startRecipe(time.monotonic() - elapsed)
+
+    def stopRecipe(self):
+        if self.recipeRunner is None:
+            return
+        self.recipeRunner.stop()
+        self.recipeThread.quit()
+        self.recipeThread.wait(1000)
+        self.recipeRunner = None
+        self.stopRecipeAction.setEnabled(False)
+
+    @pyqtSlot(float)
+    def recipe_setpoint(self, pH):
+        # Ramps step finer than the 0.1 of the spin box, so skip pH_selector_changed's rounding
+        self.pHSelectChangedSignal.emit(pH)
+        self.phSpin.blockSignals(True)
+        self.handle_pH(pH)
+        self.phSpin.blockSignals(False)
+
+    @pyqtSlot(object)
+    def recipe_pps(self, settings):
+        if not getattr(self, "ppsWorker", None):
+            print("[Recipe] No PPS connected, step skipped")
+            return
+        if "mode" in settings:
+            self.modeToggle.setChecked(settings["mode"].upper() == "CC")
+        if "voltage" in settings:
+            self.voltageDial.setValue(int(round(float(settings["voltage"]) * 10)))
+        if "current" in settings:
+            self.currentDial.setValue(int(round(float(settings["current"]) * 10)))
+        self.apply_ps_settings()
+        if "output" in settings:
+            self.powerButton.setChecked(bool(settings["output"]))
+            self.togglePowerSupply()
+            if self.start:
+                self.logger.log_change("Power", "ON" if settings["output"] else "OFF")
+
+    @pyqtSlot(str)
+    def recipe_step(self, line):
+        print(f"[Recipe] {line}")
+        self.statusBar().showMessage(line, 10000)
+        if hasattr(self, 'ppsWorker') and self.start:
+            self.logger.log_change("Recipe", line)
+
     def reset_pHStat(self):
         # Create a confirmation dialog
         reply = QMessageBox.question(self, 'Reset?',
@@ -1112,10 +1548,16 @@ class MainWindow(QMainWindow):
 
         if reply == QMessageBox.Yes:
             self.logging_timer.reset()
+            self.stoppedAt = None
+            self.csvWriter.close_all()
+            if self.Log_file[0]:
+                close_session(os.path.dirname(self.Log_file[0]))
             self.Log_file = ["","","","","",""]
             self.Log_date = [0,0,0,0,0,0]
             #self.valueData[0] = 0
             self.valueData = [0,0,0,0,0,0]
+            for buffer in self.channelBuffers:
+                buffer.clear()
             self.stopbutton.setEnabled(False)
             self.resetbutton.setEnabled(False)
             self.pumpLabel.setEnabled(False)
@@ -1130,19 +1572,25 @@ class MainWindow(QMainWindow):
         status_bar = QStatusBar()
         self.setStatusBar(status_bar)
         status_bar.showMessage("Ready")
+        self.probeLabel = QLabel("")
+        status_bar.addPermanentWidget(self.probeLabel)
 
    
-    def setuppHWorker(self):
-         # Initialize the worker and thread
-        self.pHThread = QThread()
-        self.pHWorker = pHWorker(self.send_counter, self.test_time, self.read, self.pHdata, self.pHdev, self.temp)
-        self.pHWorker.moveToThread(self.pHThread)
-        # Connections
-        self.pHWorker.update_signal_pH.connect(self.update_gui)
-
-        self.pHThread.started.connect(self.pHWorker.run)
-        
-        self.pHThread.start()
+    def setupBusWorker(self):
+        # One worker per I2C bus polls every EZO probe on that bus
+        self.busWorkers = []
+        self.busThreads = []
+        for bus in sorted({probe["bus"] for probe in self.probes}):
+            thread = QThread()
+            worker = BusWorker([probe for probe in self.probes if probe["bus"] == bus])
+            worker.moveToThread(thread)
+            # Connections
+            worker.update_signal.connect(self.handle_sample)
+            thread.started.connect(worker.run)
+
+            thread.start()
+            self.busWorkers.append(worker)
+            self.busThreads.append(thread)
 
     # --- utilities -------------------------------------------------
     def _disable_pps_controls(self):
@@ -1167,7 +1615,10 @@ class MainWindow(QMainWindow):
 
     def setupPPSWorker(self):
         
-        port = find_voltcraft_pps()
+        if self.plant is not None:
+            port, pps = "simulated", SimPPS(self.plant)
+        else:
+            port, pps = find_voltcraft_pps(), None
         if not port:
             print("[PPS] No PPS found — running without power-supply.")
             self._disable_pps_controls()
@@ -1175,7 +1626,7 @@ class MainWindow(QMainWindow):
         
         #self.ppsWorker = PPSWorker(port, 0.5, reset=False)
         try:
-            temp_worker = PPSWorker(port, 0.5, reset=True)
+            temp_worker = PPSWorker(port, 0.5, reset=True, pps=pps)
             if not temp_worker.is_connected():
                 raise RuntimeError("No PPS detected")
             self.ppsThread = QThread()
@@ -1196,33 +1647,71 @@ class MainWindow(QMainWindow):
             print(f"[PPS] Not connected: {e}")
             self._disable_pps_controls()
 
-    def setupRTDWorker(self):
-        # Initialize the RTD worker, connections and start thread
-        self.RTDThread = QThread()
-        self.RTDWorker = RTDWorker(self.send_counter, self.test_time, self.read, 20, self.RTDdev)
-        self.RTDWorker.moveToThread(self.RTDThread)
-        self.RTDWorker.update_signal_RTD.connect(self.update_gui)
-        self.RTDThread.started.connect(self.RTDWorker.run)
-
-        self.RTDThread.start()
-
-   
     def setupStatWorker(self):
 
         self.StatThread = QThread()
-        self.StatWorker = StatWorker(int(self.Select), float(self.pHSelect), self.valueData[0] )
+        self.StatWorker = StatWorker(int(self.Select), float(self.pHSelect), self.valueData[0],
+                                     self.makeControllers(), float(self.cooldown),
+                                     base_channel=int(self.basechannel), acid_channel=int(self.acidchannel),
+                                     deadband=float(self.deadband),
+                                     dosing=self.dosing, pwm_period=float(self.pwmperiod),
+                                     adaptive=self.adaptiveCooldown, min_cooldown=float(self.mincooldown),
+                                     max_cooldown=float(self.maxcooldown))
         self.StatWorker.moveToThread(self.StatThread)
-        self.StatThread.started.connect(self.StatWorker.run)
         self.startProcessingSignal.connect(self.StatWorker.start_processing)
-        self.pHWorker.update_signal_pH.connect(self.StatWorker.update_pH)
+        self.selectChangedSignal.connect(self.StatWorker.update_select)
+        self.pHSelectChangedSignal.connect(self.StatWorker.update_pH_select)
+        self.controllerChangedSignal.connect(self.StatWorker.update_controller)
+        self.dosingChangedSignal.connect(self.StatWorker.update_dosing)
+        self.adaptiveCooldownSignal.connect(self.StatWorker.update_adaptive)
+        self.restoreStateSignal.connect(self.StatWorker.restore_state)
+        self.StatWorker.cooldown_signal.connect(self.cooldown_estimated)
+        for worker in self.busWorkers:
+            worker.update_signal.connect(self.StatWorker.update_pH)
         #self.pH_settings_window.select_changed.connect(self.StatWorker.update_pH_select)
         #self.select_settings_window.select_changed.connect(self.StatWorker.update_select)
         
         self.StatWorker.status_signal.connect(self.handle_Stat)
-        self.StatWorker.pump_signal.connect(self.pumpInput)
+        self.StatWorker.dose_signal.connect(self.pumpDose)
+        self.StatWorker.duty_signal.connect(self.pumpDuty)
         # Sends the current index (position) of the selected item.
         self.StatThread.start()
     
+    def setupPumpWorker(self):
+        # Pulses are timed on their own thread so a busy GUI cannot stretch a dose
+        self.PumpThread = QThread()
+        self.PumpWorker = PumpWorker(self.mosfet)
+        self.PumpWorker.moveToThread(self.PumpThread)
+        self.PumpWorker.pump_on.connect(self.pump_started)
+        self.PumpWorker.pulse_done.connect(self.pulse_done)
+        self.PumpWorker.duty_changed.connect(self.pump_duty_changed)
+        self.PumpWorker.duty_changed.connect(self.StatWorker.pump_duty_changed)
+        # The controller only counts a dose once the pump really started it
+        self.PumpWorker.pump_on.connect(self.StatWorker.pump_started)
+        self.PumpWorker.pulse_dropped.connect(self.StatWorker.pump_dropped)
+        self.PumpThread.started.connect(self.PumpWorker.run)
+        self.PumpThread.start()
+
+        # Independent check that the board does what PumpWorker commanded
+        self.WatchdogThread = QThread()
+        self.pumpWatchdog = PumpWatchdog(self.PumpWorker, self.mosfet, max_on_time=float(self.maxontime))
+        self.pumpWatchdog.moveToThread(self.WatchdogThread)
+        self.pumpWatchdog.incident_signal.connect(self.pump_incident)
+        self.WatchdogThread.started.connect(self.pumpWatchdog.run)
+        self.WatchdogThread.start()
+
+    @pyqtSlot(str)
+    def pump_incident(self, text):
+        self.statusBar().showMessage(f"Pump watchdog switched the pumps off: {text}")
+
+    def setupCSVWriter(self):
+        # Log rows are written from here, the session files stay open
+        self.csvThread = QThread()
+        self.csvWriter = CSVWriter(float(self.flushinterval), self.fsync)
+        self.csvWriter.moveToThread(self.csvThread)
+        self.csvThread.started.connect(self.csvWriter.run)
+        self.csvThread.start()
+
     def setupUSBWorker(self):
 
         self.USBThread = QThread()
@@ -1248,8 +1737,9 @@ class MainWindow(QMainWindow):
     #    self.usb_copy()
     
     def usb_copy(self):
-        
-        
+        # Everything logged so far has to be on disk before copying
+        self.csvWriter.flush(wait=True)
+
         dir_path = os.path.dirname(self.Log_file[0])
         pattern = r'(\d{2}_\d{2}_\d{4}/\d{2}_\d{2})'
 
@@ -1279,7 +1769,11 @@ class MainWindow(QMainWindow):
         #print("Extracted source_dir:", dir_path)
         if os.path.exists(folder_path):
             shutil.rmtree(folder_path)
-        shutil.copytree(dir_path, folder_path)
+        # The parse caches of the logs stay behind, load_log makes new ones when needed
+        shutil.copytree(dir_path, folder_path, ignore=shutil.ignore_patterns("*" + LOG_CACHE_SUFFIX))
+        if self.binaryLog:
+            # The binary store goes along, plus the CSV logs everyone can open
+            export_store_csv(self.Log_file[0], folder_path, self.plotindex, self.headerindex)
         #print(f"Copied {dir_path} to {folder_path}")
 
         #shutil.copytree(dir_path, folder_path)
@@ -1309,113 +1803,66 @@ class MainWindow(QMainWindow):
         self.pHlabel.setStyleSheet(f'color: #C0392B;')
         self.pHNumber.setStyleSheet(f'color: #C0392B;')
 
+    @pyqtSlot(int, float)
+    def pumpDose(self, channel, seconds):
+        # Dose sized by the StatWorker controller, which already waits out the (adaptive) cooldown
+        self.PumpWorker.request(channel, seconds, 0, False)
+
+    @pyqtSlot(int, float)
+    def pumpDuty(self, channel, duty):
+        self.PumpWorker.set_duty(channel, duty)
+
     def pumpInput(self, test):
         if not test:
-            self.pump_control.activate_feature(int(float(self.addtime) * 1000), int(self.cooldown) * 1000, test)
+            self.PumpWorker.request(1, float(self.addtime), float(self.cooldown), test)
         else:
-            self.pump_control.activate_feature(int(float(self.addtime) * 1000), 0, test)
+            self.PumpWorker.request(1, float(self.addtime), 0, test)
     
             
-    def pump_activated(self, test):
+    @pyqtSlot(int, bool)
+    def pump_started(self, channel, test):
         self.pumpLabel.setFlash(True)
-        #self.pHWorker.pause()
-        #self.RTDWorker.pause()
-        retry_count = 5 # Number of times to retry
-        retry_delay = 0.01 # Delay between retries in second
-        success = False # Flag indicating succes
-        
-        for attempt in range(retry_count):
-            
-            try:
-                #print(f"Main trying to lock i2c_mutex for pump input")
-                #print(f"Attempt {attempt + 1}: Trying to lock i2c_mutex for pump input")
-                i2c_mutex.lock()
-                #print(f"i2c_mutex locked for pump input")
-
-                #print(f"i2c_mutex locked for pump input")
-                lib8mosind.set(0,1,1)
-                #print(f"Pump on operation performed successfully on attempt {attempt + 1}")
-                #i2c_mutex.unlock()
-                #print(f"Pump input operation performed")
-                success = True
-                self.pump_start_time = time.time()  # Record the start time
-                break # Exit the function if succesvol
-            except Exception as e:
-                print(f"Error during pump on input: {e}")
-                pass
-            finally:
-                try:
-                    i2c_mutex.unlock()
-                    print(f"Main unlocking i2c_mutex after pump on on attempt {attempt + 1}")
-                except Exception as unlock_error:
-                    print(f"Error unlocking i2c_mutex: {unlock_error}")
-                if not success:
-                    time.sleep(retry_delay)	# Wait before retrying
-                
-        
-    
-    def pump_deactivated(self, test):
-        
-        retry_count = 5 # Number of times to retry
-        retry_delay = 0.01 # Delay between retries in second
-        success = False
-        
-        for attempt in range(retry_count):
-        
-            try:
-                #print(f"Attempt {attempt + 1}: Trying to lock i2c_mutex for pump input")
-                i2c_mutex.lock()
-                #print(f"i2c_mutex locked for pump input")
-                lib8mosind.set(0,1,0)
-                #print(f"Pump off operation performed successfully on attempt {attempt + 1}")
-                #i2c_mutex.unlock()
-                #print(f"Pump input operation performed")
-                success = True
-                break # Exit the function if succesful
-            
-            except Exception as e:
-                print(f"Error during pump off input: {e}")
-                pass
-            finally:
-                #print(f"Main unlocking i2c_mutex after pump input")
-                try:
-                    i2c_mutex.unlock()
-                    print(f"Main unlocking i2c_mutex after pump off on attempt {attempt + 1}")
-                except Exception as unlock_error:
-                    print(f"Error unlocking i2c_mutex: {unlock_error}")
-                if not success:
-                    time.sleep(retry_delay) # Wait before retrying
-        
-        
-        if not test:
-            self.pumpLabel.setFlash(False)
-        else:
-            self.pumpLabel.setEnabled(False)
-        
-        if success:
-            if self.pump_start_time is not None:
-                self.elapsed_time = time.time() - self.pump_start_time
-                print(f"Time between pump activation and deactivation: {self.elapsed_time:.4f} seconds")
-            
-                if not test :
-                    self.valueData[0] += 1.0
-                    self.totalml = self.totalml + (float(self.ml)/float(self.addtime))*self.elapsed_time
-                    print(round(self.totalml,3)) 
-                    #data = self.valueData[0] * float(self.ml)
-                    log_csv(self, round(self.totalml,3), 0, self.headerindex[0])
-       
-                self.pump_start_time = None  # Reset the start time
+
+    @pyqtSlot(int, float)
+    def pump_duty_changed(self, channel, duty):
+        self.pumpLabel.setFlash(duty > 0)
+
+    @pyqtSlot(object)
+    def pulse_done(self, pulse):
+        if not pulse.pwm:
+            if not pulse.test:
+                self.pumpLabel.setFlash(False)
             else:
-                print("Warning: Pump was not active, no elapsed time to calculate.")
-    
-    
+                self.pumpLabel.setEnabled(False)
+            print(f"Pump {pulse.channel} pulse {pulse.measured:.4f} s (commanded {pulse.commanded:.4f} s)")
+            self.elapsed_time = pulse.measured
+
+        if not pulse.test and self.doseLedger is not None:
+            if not pulse.pwm:
+                self.valueData[0] += 1.0
+            volume = self.doseLedger.append(pulse)
+            self.totalml = self.doseLedger.total()
+            self.checkpoint()
+            print(round(self.totalml,3))
+            if self.sessionStore is not None:
+                self.sessionStore.append(self.logging_timer.elapsed(), [round(self.totalml,3)] + [None] * 5)
+            elif self.wideLog:
+                log_event(self, pulse, volume, round(self.totalml,3))
+            else:
+                log_csv(self, round(self.totalml,3), 0, self.headerindex[0])
+            self.record(0, round(self.totalml,3))
+
     def handle_select(self, select):
+        self.Select = select
         if select == 0:
             self.keepSelector.setCurrentIndex(0)
             self.statustext = "above"
-        else:
+        elif select == 1:
             self.keepSelector.setCurrentIndex(1)
             self.statustext = "below"
+        else:
+            self.keepSelector.setCurrentIndex(2)
+            self.statustext = f"within ±{self.deadband} of"
         self.keepSelector.setStatusTip(f'Settings of pH Stat, Keep the experiment {self.statustext} a pH of {self.pHSelect}')
         ConfigWriter(self)
         #print(f"Received signal with value: {value}")
@@ -1464,15 +1911,34 @@ class MainWindow(QMainWindow):
         self.ml = ml
         self.addtime = addtime
         ConfigWriter(self)
+        self.updateController()
+        if self.doseLedger is not None:
+            # Account the whole run so far with the new calibration
+            self.doseLedger.recompute(self.pumpCurves())
+            self.totalml = self.doseLedger.total()
+
+    def pumpCurves(self):
+        # Channels without a [PUMP <n>] curve use the calibration dialog's ml per addtime
+        points = PumpCurveReader()
+        return {channel: PumpCurve(points.get(channel, [(float(self.addtime), float(self.ml))]))
+                for channel in range(1, 9)}
         #print(f"Received signal with value: {value}")
         # Handle the change in the main GUI here
         
     @pyqtSlot(str, float, object)
     def handle_calibrate(self, calibrationType, pH, data):
-        # Pause the worker
-        self.pHWorker.pause()
+        if self.pHdev is None:
+            print("No pH probe configured, cannot calibrate.")
+            return
+        # Pause polling of the pH probe
+        for worker in self.busWorkers:
+            worker.pause(self.pHdev)
         self.pauzeWorker.start(2000)
         self.CalcWorker.start(1300)
+        # CalcWorkerRead keeps polling a busy probe until short_timeout after the first read
+        self.calcAttempt = 0
+        self.calcPoll = self.pHdev.min_poll
+        self.calcDeadline = time.monotonic() + 1.3 + self.pHdev.short_timeout
 
         #print(f"{calibrationType},{pH},{data[0]}")
         QTimer.singleShot(300, lambda: self.queryInstructions(calibrationType, pH))
@@ -1575,9 +2041,13 @@ class MainWindow(QMainWindow):
         command = (f"Cal,{calibrationType},{pH}")
         
         try:
-            self.pHdev.query(command)
+            # Only send it, CalcWorkerRead picks up the answer once the probe is done
+            lock_i2c()
+            self.pHdev.write(command)
         except Exception as e:
             print(f"{e}")
+        finally:
+            i2c_mutex.unlock()
         
     def instructions(self, command):
         
@@ -1610,13 +2080,30 @@ class MainWindow(QMainWindow):
     #    # Create and show the Settings window as a separate window
     #    self.select_settings_window.exec_()
     
+    def openDiagnosticsWindow(self):
+        if not hasattr(self, "diagnostics_window"):
+            self.diagnostics_window = DiagnosticsDialog()
+        self.diagnostics_window.show()
+        self.diagnostics_window.raise_()
+
     def openCalibratepHWindow(self):
         # Create and show the Settings window as a separate window
         self.pH_calibrate_window.exec_()
     
 
+    def handle_sample(self, sample):
+        if sample.type is None:
+            # Additional probes are only shown in the status bar
+            self.probeValues[sample.device] = sample.value
+            self.probeLabel.setText("   ".join(f"{name} {value:.2f}" for name, value in self.probeValues.items()))
+            return
+        if sample.type == 1 and sample.temp is not None:
+            self.pHNumber.setStatusTip(f"Current pH measured (compensated at {sample.temp:.1f} °C)")
+        self.update_gui(sample.value, sample.type)
+
     def update_gui(self, received_data, type):
         self.current_data = received_data
+        self.record(type, received_data)
         if type == 1:
             self.pHNumber.setText(f'{str("pH {:.2f}".format(received_data))}')
             #self.pHvalue = received_data
@@ -1628,7 +2115,6 @@ class MainWindow(QMainWindow):
             else:
                 self.RTDlabel.setText(f"{received_data:.2f} °C")
             self.valueData[2] = received_data
-            self.pHWorker.pH_temp = round(received_data,1)
         elif type == 3:   
             self.valueData[3] = received_data 
         elif type == 4:   
@@ -1648,17 +2134,27 @@ class MainWindow(QMainWindow):
 
         if reply == QMessageBox.Yes:
             # Stop the worker
-            self.pHWorker.stop()
-            self.pHThread.quit()
-
-            self.RTDWorker.stop()
-            self.RTDThread.quit()
+            for worker, thread in zip(self.busWorkers, self.busThreads):
+                worker.stop()
+                thread.quit()
 
             self.StatWorker.stop()
             self.StatThread.quit()
+
+            self.PumpWorker.stop()
+            self.PumpThread.quit()
+            self.PumpThread.wait(1000)
+            self.pumpWatchdog.stop()
+            self.WatchdogThread.quit()
             
             self.USBWorker.stop()
             self.USBThread.quit()
+
+            self.stopRecipe()
+
+            self.csvWriter.stop()
+            self.csvThread.quit()
+            self.csvThread.wait(2000)
             
             event.accept()  # Accept the close event
 
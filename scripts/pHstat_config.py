@@ -17,6 +17,35 @@ def ConfigReader(self):
     lowpH = config['SETTINGS']['lowpH']
     midpH = config['SETTINGS']['midpH']
     highpH = config['SETTINGS']['highpH']
+    # Controller settings, older settings.ini files do not have them yet
+    controller = config['SETTINGS'].get('controller', 'bangbang')
+    kp = config['SETTINGS'].get('kp', '0.5')
+    ki = config['SETTINGS'].get('ki', '0.01')
+    kd = config['SETTINGS'].get('kd', '0.0')
+    mindose = config['SETTINGS'].get('mindose', '0.05')
+    maxdose = config['SETTINGS'].get('maxdose', '2.0')
+    # MOSFET channels for the two sided "Keep At" mode and its band in pH
+    basechannel = config['SETTINGS'].get('basechannel', '1')
+    acidchannel = config['SETTINGS'].get('acidchannel', '2')
+    deadband = config['SETTINGS'].get('deadband', '0.05')
+    # pulse or pwm, and the seconds a PWM dose is spread over
+    dosing = config['SETTINGS'].get('dosing', 'pulse')
+    pwmperiod = config['SETTINGS'].get('pwmperiod', '1.0')
+    # Longest a single pulse may keep a pump on before the watchdog cuts it
+    maxontime = config['SETTINGS'].get('maxontime', '10')
+    # Cooldown learned from the pH response, kept between the two bounds in s
+    adaptivecooldown = config['SETTINGS'].get('adaptivecooldown', 'False')
+    mincooldown = config['SETTINGS'].get('mincooldown', '2')
+    maxcooldown = config['SETTINGS'].get('maxcooldown', '60')
+    # Seconds between commits of the CSV logs (0 = every row), fsync after each commit
+    flushinterval = config['SETTINGS'].get('flushinterval', '5')
+    fsync = config['SETTINGS'].get('fsync', 'True')
+    # One Session log with every channel plus a Pump events file, instead of a file per channel
+    widelog = config['SETTINGS'].get('widelog', 'False')
+    # Log to a chunked binary store, the CSV files are only written on USB copy
+    binarylog = config['SETTINGS'].get('binarylog', 'False')
+    # Seconds between checkpoints of a running session, one is also written after every dose
+    checkpointinterval = config['SETTINGS'].get('checkpointinterval', '5')
 
 
 
@@ -30,6 +59,26 @@ def ConfigReader(self):
     self.lowpH = lowpH
     self.midpH = midpH
     self.highpH = highpH
+    self.controllerMode = controller
+    self.kp = kp
+    self.ki = ki
+    self.kd = kd
+    self.mindose = mindose
+    self.maxdose = maxdose
+    self.basechannel = basechannel
+    self.acidchannel = acidchannel
+    self.deadband = deadband
+    self.dosing = dosing
+    self.pwmperiod = pwmperiod
+    self.maxontime = maxontime
+    self.adaptiveCooldown = adaptivecooldown == 'True'
+    self.mincooldown = mincooldown
+    self.maxcooldown = maxcooldown
+    self.flushinterval = flushinterval
+    self.fsync = fsync == 'True'
+    self.wideLog = widelog == 'True'
+    self.binaryLog = binarylog == 'True'
+    self.checkpointinterval = checkpointinterval
     
     
 def ConfigWriter(self):
@@ -47,6 +96,87 @@ def ConfigWriter(self):
     config.set('SETTINGS', 'lowpH', str(self.lowpH))
     config.set('SETTINGS', 'midpH', str(self.midpH))
     config.set('SETTINGS', 'highpH', str(self.highpH))
+    config.set('SETTINGS', 'controller', str(self.controllerMode))
+    config.set('SETTINGS', 'kp', str(self.kp))
+    config.set('SETTINGS', 'ki', str(self.ki))
+    config.set('SETTINGS', 'kd', str(self.kd))
+    config.set('SETTINGS', 'mindose', str(self.mindose))
+    config.set('SETTINGS', 'maxdose', str(self.maxdose))
+    config.set('SETTINGS', 'basechannel', str(self.basechannel))
+    config.set('SETTINGS', 'acidchannel', str(self.acidchannel))
+    config.set('SETTINGS', 'deadband', str(self.deadband))
+    config.set('SETTINGS', 'dosing', str(self.dosing))
+    config.set('SETTINGS', 'pwmperiod', str(self.pwmperiod))
+    config.set('SETTINGS', 'maxontime', str(self.maxontime))
+    config.set('SETTINGS', 'adaptivecooldown', str(self.adaptiveCooldown))
+    config.set('SETTINGS', 'mincooldown', str(self.mincooldown))
+    config.set('SETTINGS', 'maxcooldown', str(self.maxcooldown))
+    config.set('SETTINGS', 'flushinterval', str(self.flushinterval))
+    config.set('SETTINGS', 'fsync', str(self.fsync))
+    config.set('SETTINGS', 'widelog', str(self.wideLog))
+    config.set('SETTINGS', 'binarylog', str(self.binaryLog))
+    config.set('SETTINGS', 'checkpointinterval', str(self.checkpointinterval))
     
     config.write(configfile)
     configfile.close()
+
+# Used when settings.ini has no [PROBE <name>] sections
+default_probes = [
+    {"name": "pH", "kind": "pH", "address": 99, "bus": 1, "interval": 0.0, "compensate": "RTD", "channel": "pH"},
+    {"name": "RTD", "kind": "RTD", "address": 102, "bus": 1, "interval": 0.0, "compensate": None, "channel": "RTD"},
+]
+
+def ProbeReader():
+    """Return the EZO probes listed as [PROBE <name>] sections in settings.ini.
+
+    Keys per section: address, kind (pH, RTD, ORP, EC, DO; defaults to the
+    name), bus (default 1), interval in s between readings (0 = as fast as
+    the circuit allows), compensate (name of the RTD probe to compensate
+    with) and channel (pH or RTD for the probe shown in the main window).
+    """
+    config = configparser.ConfigParser()
+    config.read('settings.ini')
+    probes = []
+    for section in config.sections():
+        if not section.upper().startswith('PROBE '):
+            continue
+        name = section[len('PROBE '):].strip()
+        probes.append({
+            "name": name,
+            "kind": config.get(section, 'kind', fallback=name),
+            "address": config.getint(section, 'address'),
+            "bus": config.getint(section, 'bus', fallback=1),
+            "interval": config.getfloat(section, 'interval', fallback=0.0),
+            "compensate": config.get(section, 'compensate', fallback='') or None,
+            "channel": config.get(section, 'channel', fallback='') or None,
+        })
+    if not probes:
+        return [dict(probe) for probe in default_probes]
+
+    addresses = [(probe["bus"], probe["address"]) for probe in probes]
+    if len(set(addresses)) != len(addresses):
+        raise ValueError("Two probes in settings.ini share the same bus and address")
+    return probes
+
+def PumpCurveReader():
+    """Return {channel: [(seconds, ml), ...]} from [PUMP <channel>] sections in settings.ini.
+
+    curve is a comma separated list of seconds:ml calibration points, e.g.
+    curve = 0.1:0.041, 0.2:0.098, 1.0:0.52. Channels without a section use
+    the ml/addtime point of the pump calibration dialog.
+    """
+    config = configparser.ConfigParser()
+    config.read('settings.ini')
+    curves = {}
+    for section in config.sections():
+        if not section.upper().startswith('PUMP '):
+            continue
+        channel = int(section[len('PUMP '):])
+        points = []
+        for point in config.get(section, 'curve', fallback='').split(','):
+            if point.strip():
+                seconds, ml = point.split(':')
+                points.append((float(seconds), float(ml)))
+        if points:
+            curves[channel] = points
+    return curves
@@ -3,7 +3,7 @@ from PyQt5.QtGui import QPen, QColor
 from PyQt5.QtCore import Qt
 import numpy as np
 import pyqtgraph as pg
-from scripts.pHStat_csv import read_log_data, scale_time_data  # if not already imported in main
+from scripts.pHStat_csv import scale_time_data  # if not already imported in main
 
 class PlotManager:
     def __init__(self, main):
@@ -123,7 +123,7 @@ class PlotManager:
         plot_index: index in self.main.graphWidgets
         curve_configs: list of dicts like:
             {
-                "log_index": 1,
+                "log_index": 1,   # index in self.main.channelBuffers (same as the log files)
                 "curve_attr": "pH_curve",
                 "pen": "g",
                 "use_right_axis": False
@@ -135,7 +135,7 @@ class PlotManager:
         max_points = 1000
 
         for cfg in curve_configs:
-            data_time, data_values = read_log_data(self.main, cfg["log_index"])
+            data_time, data_values = self.main.channelBuffers[cfg["log_index"]].window()
 
             # Remove old curve if exists
             curve_attr = cfg["curve_attr"]
@@ -148,12 +148,15 @@ class PlotManager:
                     widget.removeItem(getattr(self.main, curve_attr))
                 setattr(self.main, curve_attr, None)
 
-            if data_time and data_values:
+            if len(data_time):
                 x_data, y_data, time_label, _ = scale_time_data(self.main, data_time, data_values)
 
                 if len(x_data) > max_points:
-                    x_data = x_data[-max_points:]
-                    y_data = y_data[-max_points:]
+                    # Thin out the whole run evenly, always keeping the latest point
+                    step = -(-len(x_data) // max_points)
+                    first = (len(x_data) - 1) % step
+                    x_data = x_data[first::step]
+                    y_data = y_data[first::step]
 
                 pen = pg.mkPen(cfg["pen"], width=2)
                 curve = pg.PlotCurveItem(x_data, y_data, pen=pen)
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The scripts package pulls in PyQt5 and pyqtgraph through its __init__, the
+# plain modules are imported straight from the folder instead
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+sys.path.insert(0, ROOT)
@@ -0,0 +1,119 @@
+import math
+
+import pytest
+
+from pHStat_control import (BangBangController, PIDController, ModelDoseController, Trend, ResponseEstimator,
+                            make_controller, MODE_PID, MODE_MODEL, MODE_BANGBANG)
+
+def test_make_controller_modes():
+    assert isinstance(make_controller(MODE_PID, 1.0, 1, 0.1, 0, 0.1, 5), PIDController)
+    assert isinstance(make_controller(MODE_MODEL, 1.0, 1, 0.1, 0, 0.1, 5), ModelDoseController)
+    assert isinstance(make_controller(MODE_BANGBANG, 1.0, 1, 0.1, 0, 0.1, 5), BangBangController)
+    assert isinstance(make_controller("unknown", 1.0, 1, 0.1, 0, 0.1, 5), BangBangController)
+
+def test_bangbang_doses_addtime_only_on_the_wrong_side():
+    controller = BangBangController(0.8)
+    assert controller.dose(0.2, 0.0, 0.0) == 0.8
+    assert controller.dose(-0.2, 0.0, 0.0) == 0.0
+
+def test_trend_follows_the_slope():
+    trend = Trend(smoothing=1.0)
+    trend.update(7.0, 0.0)
+    trend.update(7.2, 10.0)
+    assert trend.slope == pytest.approx(0.02)
+    trend.reset()
+    assert trend.slope == 0.0 and trend.pH is None
+
+def test_pid_integrates_error_over_time():
+    pid = PIDController(kp=0.0, ki=1.0, kd=0.0, min_dose=0.0, max_dose=100.0)
+    pid.update(0.5, 0.0, 0.0)   # First update only sets the time
+    pid.update(0.5, 0.0, 2.0)
+    assert pid.integral == pytest.approx(1.0)
+    assert pid.dose(0.5, 0.0, 2.0) == pytest.approx(1.0)
+
+def test_pid_reset_drops_what_was_integrated_while_idle():
+    # StatWorker resets at every start, so a long idle error does not come out as one big dose
+    pid = PIDController(kp=0.0, ki=1.0, kd=0.0, min_dose=0.0, max_dose=100.0)
+    pid.update(0.5, 0.0, 0.0)
+    pid.update(0.5, 0.0, 60.0)
+    pid.reset()
+    assert pid.integral == 0.0
+    pid.update(0.5, 0.0, 120.0)
+    assert pid.integral == 0.0
+
+def test_pid_restore_does_not_integrate_the_downtime():
+    pid = PIDController(kp=0.0, ki=1.0, kd=0.0, min_dose=0.0, max_dose=100.0)
+    pid.update(0.5, 0.0, 0.0)
+    pid.update(0.5, 0.0, 4.0)
+    state = pid.state()
+    restored = PIDController(kp=0.0, ki=1.0, kd=0.0, min_dose=0.0, max_dose=100.0)
+    restored.restore(state)
+    restored.update(0.5, 0.0, 1000.0)
+    assert restored.integral == pytest.approx(2.0)
+
+def test_pid_stops_integrating_while_saturated():
+    pid = PIDController(kp=10.0, ki=1.0, kd=0.0, min_dose=0.0, max_dose=1.0)
+    pid.update(1.0, 0.0, 0.0)
+    pid.update(1.0, 0.0, 10.0)
+    assert pid.integral == 0.0
+    assert pid.dose(1.0, 0.0, 10.0) == 1.0
+
+def test_pid_below_min_dose_gives_nothing():
+    pid = PIDController(kp=1.0, ki=0.0, kd=0.0, min_dose=0.2, max_dose=5.0)
+    assert pid.dose(0.1, 0.0, 0.0) == 0.0
+    assert pid.dose(0.3, 0.0, 0.0) == pytest.approx(0.3)
+
+def test_model_probes_then_learns_the_gain():
+    model = ModelDoseController(addtime=1.0, min_dose=0.05, max_dose=10.0, lookahead=0.0, aggressiveness=1.0)
+    assert model.dose(0.5, 0.0, 0.0) == 1.0
+    model.dosed(1.0, 0.5, 0.0, 0.0)
+    # The 1 s probe moved the pH by 0.1, the remaining 0.4 takes 4 s
+    assert model.dose(0.4, 0.0, 10.0) == pytest.approx(4.0)
+    assert model.gain == pytest.approx(0.1)
+
+def test_model_restore_keeps_the_gain_only():
+    model = ModelDoseController(addtime=1.0, min_dose=0.05, max_dose=10.0)
+    model.gain = 0.2
+    model.dosed(1.0, 0.5, 0.0, 0.0)
+    restored = ModelDoseController(addtime=1.0, min_dose=0.05, max_dose=10.0)
+    restored.restore(model.state())
+    assert restored.gain == 0.2 and restored.pending is None
+
+def track(estimator, start, delay, tau, until, step=0.5, size=0.3):
+    """Feed the estimator a first order response with dead time to a dose ending at *start*."""
+    estimator.start(start, 7.0, 0.0, 1)
+    t = step
+    while t <= until:
+        rise = size * (1 - math.exp(-(t - delay) / tau)) if t > delay else 0.0
+        estimator.sample(7.0 + rise, start + t)
+        t += step
+
+def test_response_learns_delay_and_tau():
+    estimator = ResponseEstimator(10.0, 2.0, 60.0)
+    track(estimator, 0.0, delay=3.0, tau=4.0, until=30.0)
+    assert estimator.finish()
+    # 10 % of the peak a bit after the dead time, 63 % one tau after that
+    assert estimator.delay == pytest.approx(3.5, abs=0.5)
+    assert estimator.delay + estimator.tau == pytest.approx(7.0, abs=0.5)
+    assert estimator.cooldown == pytest.approx(estimator.delay + 3.0 * estimator.tau)
+
+def test_response_cut_short_stretches_the_cooldown_until_there_is_an_estimate():
+    estimator = ResponseEstimator(5.0, 2.0, 60.0)
+    track(estimator, 0.0, delay=1.0, tau=20.0, until=8.0)
+    assert estimator.finish()
+    assert estimator.delay is None
+    assert estimator.cooldown == pytest.approx(12.0)
+    track(estimator, 100.0, delay=3.0, tau=4.0, until=30.0)
+    estimator.finish()
+    learned = estimator.cooldown
+    # With an estimate a track cut short is left out
+    track(estimator, 200.0, delay=1.0, tau=20.0, until=8.0)
+    assert not estimator.finish()
+    assert estimator.cooldown == learned
+
+def test_response_ignores_noise_and_keeps_within_limits():
+    estimator = ResponseEstimator(100.0, 2.0, 60.0)
+    assert estimator.cooldown == 60.0
+    track(estimator, 0.0, delay=1.0, tau=1.0, until=10.0, size=0.005)
+    assert not estimator.finish()
+    assert estimator.delay is None
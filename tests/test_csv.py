@@ -0,0 +1,62 @@
+import math
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("pyqtgraph")
+
+from scripts.pHStat_csv import load_log, format_number, LOG_CACHE_SUFFIX
+
+PRE_HEADER = "pH\nDate 18-10-2026\nStart Time 10:00:00\n"
+
+def write(path, text, mode="w"):
+    with open(path, mode, newline="") as f:
+        f.write(text)
+
+def test_format_number_is_dutch():
+    assert format_number(1234.5678, 3) == "1234,568"
+    assert format_number(1234.5678, 3, grouping=True) == "1.234,568"
+    assert format_number(-0.5, 1) == "-0,5"
+
+def test_load_log_parses_dutch_decimals(tmp_path):
+    path = str(tmp_path / "pH_log.csv")
+    write(path, PRE_HEADER + "Reaction time (s);pH\n0;7,012\n5;1.234,5\n10;N/A\n")
+    pre_header, header, table = load_log(path)
+    assert pre_header == ["pH", "Date 18-10-2026", "Start Time 10:00:00"]
+    assert header == ["Reaction time (s)", "pH"]
+    assert table[:2].tolist() == [[0.0, 7.012], [5.0, 1234.5]]
+    assert math.isnan(table[2, 1])
+
+def test_load_log_wide_empty_cells_and_torn_row(tmp_path):
+    path = str(tmp_path / "Session_log.csv")
+    write(path, PRE_HEADER + "Reaction time (s);pH;Temperature (°C)\r\n0;7,0;21,5\r\n5;;21,6\r\n10;7,1;\r\n15;7,")
+    _, _, table = load_log(path)
+    assert table.shape == (3, 3)
+    assert math.isnan(table[1, 1]) and math.isnan(table[2, 2])
+    assert table[2, 1] == 7.1
+
+def test_load_log_uses_and_extends_its_cache(tmp_path):
+    path = str(tmp_path / "pH_log.csv")
+    write(path, PRE_HEADER + "Reaction time (s);pH\n" + "".join(f"{i};7,{i}\n" for i in range(5)))
+    first = load_log(path)[2]
+    assert os.path.exists(path + LOG_CACHE_SUFFIX)
+    write(path, "5;8,0\n", "a")
+    table = load_log(path)[2]
+    assert np.array_equal(table[:5], first)
+    assert table[-1].tolist() == [5.0, 8.0]
+
+def test_load_log_ignores_a_stale_cache(tmp_path):
+    path = str(tmp_path / "pH_log.csv")
+    write(path, PRE_HEADER + "Reaction time (s);pH\n0;7,0\n5;7,1\n")
+    load_log(path)
+    # Rewritten with other rows, the bytes before the cached end no longer match
+    write(path, PRE_HEADER + "Reaction time (s);pH\n0;6,0\n5;6,1\n10;6,2\n")
+    assert load_log(path)[2][:, 1].tolist() == [6.0, 6.1, 6.2]
+
+def test_load_log_without_header(tmp_path):
+    path = str(tmp_path / "pH_log.csv")
+    write(path, "pH\nDate\n")
+    with pytest.raises(ValueError):
+        load_log(path)
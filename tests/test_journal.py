@@ -0,0 +1,66 @@
+import os
+
+from pHStat_journal import (JournaledFile, recover, recover_session, write_session, read_session,
+                            close_session, latest_session, JOURNAL_SUFFIX, JOURNAL_RECORD)
+
+def write_log(path, chunks):
+    log = JournaledFile(path)
+    for chunk in chunks:
+        log.append(chunk)
+        log.commit()
+    log.close()
+
+def test_committed_log_is_kept(tmp_path):
+    path = str(tmp_path / "pH_log.csv")
+    write_log(path, [b"0;7,0\n", b"5;7,1\n10;7,2\n"])
+    assert recover(path) == 0
+    assert open(path, "rb").read() == b"0;7,0\n5;7,1\n10;7,2\n"
+
+def test_torn_tail_is_truncated(tmp_path):
+    path = str(tmp_path / "pH_log.csv")
+    write_log(path, [b"0;7,0\n", b"5;7,1\n"])
+    # Power lost halfway through the next chunk, before its journal record
+    with open(path, "ab") as f:
+        f.write(b"10;7,")
+    assert recover(path) == 5
+    assert open(path, "rb").read() == b"0;7,0\n5;7,1\n"
+
+def test_last_chunk_failing_its_checksum_is_dropped(tmp_path):
+    path = str(tmp_path / "pH_log.csv")
+    write_log(path, [b"0;7,0\n", b"5;7,1\n10;7,2\n"])
+    # Its record made it to disk, the data did not
+    with open(path, "r+b") as f:
+        f.seek(8)
+        f.write(b"X")
+    assert recover(path) == len(b"5;7,1\n10;7,2\n")
+    assert open(path, "rb").read() == b"0;7,0\n"
+    assert os.path.getsize(path + JOURNAL_SUFFIX) == JOURNAL_RECORD.size
+    # Appending goes on from the recovered end
+    write_log(path, [b"15;7,3\n"])
+    assert recover(path) == 0
+
+def test_log_without_journal_keeps_full_lines(tmp_path):
+    path = str(tmp_path / "power.txt")
+    with open(path, "wb") as f:
+        f.write(b"a\nb\nhalf")
+    assert recover(path) == 4
+    assert open(path, "rb").read() == b"a\nb\n"
+
+def test_recover_session_reports_the_torn_files(tmp_path):
+    write_log(str(tmp_path / "pH_log.csv"), [b"0;7,0\n"])
+    with open(tmp_path / "pH_log.csv", "ab") as f:
+        f.write(b"5;")
+    write_log(str(tmp_path / "RTD_log.csv"), [b"0;21,0\n"])
+    assert recover_session(str(tmp_path)) == {"pH_log.csv": 2}
+
+def test_session_checkpoint_round_trip(tmp_path):
+    folder = tmp_path / "Data" / "2026" / "run"
+    folder.mkdir(parents=True)
+    state = {"elapsed": 120.5, "running": True, "Log_file": ["a.csv"]}
+    write_session(str(folder), state)
+    assert read_session(str(folder)) == state
+    assert not os.path.exists(os.path.join(str(folder), "session.json.tmp"))
+    assert latest_session(tmp_path / "Data") == str(folder)
+    close_session(str(folder))
+    close_session(str(folder))
+    assert latest_session(tmp_path / "Data") is None
@@ -0,0 +1,67 @@
+import os
+from collections import namedtuple
+
+import pytest
+
+from pHStat_ledger import DoseLedger, PumpCurve, read_ledger, LEDGER_HEADER, LEDGER_RECORD
+
+Pulse = namedtuple("Pulse", "channel commanded measured start test pwm")
+
+def curves():
+    return {1: PumpCurve([(1.0, 0.5), (5.0, 2.6)]), 2: PumpCurve([(2.0, 1.0)])}
+
+def test_pump_curve_fits():
+    # One point is the plain ml per addtime flow, two a line with an offset
+    assert PumpCurve([(2.0, 1.0)]).volume(4.0) == pytest.approx(2.0)
+    line = PumpCurve([(1.0, 0.5), (5.0, 2.6)])
+    assert line.volume(3.0) == pytest.approx(1.55)
+    assert line.volume(0.0) == 0.0  # Never negative
+    assert line.flow == pytest.approx(2.6 / 5.0)
+    with pytest.raises(ValueError):
+        PumpCurve([])
+
+def test_totals_per_channel(tmp_path):
+    ledger = DoseLedger(str(tmp_path / "ledger.bin"), curves())
+    assert ledger.append(Pulse(1, 1.0, 1.0, 10.0, False, False)) == pytest.approx(0.5)
+    ledger.append(Pulse(2, 4.0, 4.0, 20.0, False, False))
+    # PWM segments count at the running flow, without the spin-up offset
+    ledger.append(Pulse(1, 5.0, 2.5, 30.0, False, True))
+    assert ledger.total(1) == pytest.approx(0.5 + 2.5 * 2.6 / 5.0)
+    assert ledger.total(2) == pytest.approx(2.0)
+    assert ledger.total() == pytest.approx(ledger.total(1) + ledger.total(2))
+    ledger.close()
+
+def test_reopen_picks_up_the_totals(tmp_path):
+    path = str(tmp_path / "ledger.bin")
+    ledger = DoseLedger(path, curves())
+    ledger.append(Pulse(1, 1.0, 1.02, 10.0, False, False))
+    ledger.append(Pulse(1, 5.0, 5.0, 30.0, False, True))
+    written = dict(ledger.totals)
+    ledger.close()
+    reopened = DoseLedger(path, curves())
+    assert reopened.count == 2
+    assert reopened.total(1) == pytest.approx(written[1], abs=1e-5)
+    records = read_ledger(path)
+    assert list(records["channel"]) == [1, 0x81]
+    reopened.close()
+
+def test_torn_record_is_dropped(tmp_path):
+    path = str(tmp_path / "ledger.bin")
+    ledger = DoseLedger(path, curves())
+    ledger.append(Pulse(2, 2.0, 2.0, 10.0, False, False))
+    ledger.close()
+    with open(path, "ab") as f:
+        f.write(b"\x01\x02\x03")
+    assert len(read_ledger(path)) == 1
+    reopened = DoseLedger(path, curves())
+    assert os.path.getsize(path) == LEDGER_HEADER.size + LEDGER_RECORD.size
+    reopened.append(Pulse(2, 2.0, 2.0, 20.0, False, False))
+    reopened.close()
+    assert list(read_ledger(path)["start"]) == [10.0, 20.0]
+
+def test_recompute_with_a_new_calibration(tmp_path):
+    ledger = DoseLedger(str(tmp_path / "ledger.bin"), curves())
+    ledger.append(Pulse(2, 2.0, 2.0, 10.0, False, False))
+    totals = ledger.recompute({2: PumpCurve([(2.0, 3.0)])})
+    assert totals[2] == pytest.approx(3.0)
+    ledger.close()
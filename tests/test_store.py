@@ -0,0 +1,50 @@
+import math
+import os
+
+import numpy as np
+
+from pHStat_store import SessionStore, read_store, store_started, chunk_paths, split_header
+
+HEADERS = ["Injections (ml)", "pH", "Temperature (°C)"]
+
+def test_split_header():
+    assert split_header("Temperature (°C)") == ("Temperature", "°C")
+    assert split_header("pH") == ("pH", "")
+
+def test_rows_come_back_per_column(tmp_path):
+    base = str(tmp_path / "Session")
+    store = SessionStore(base, HEADERS)
+    store.append(0.0, [0.0, 7.0, 21.5])
+    store.append(5.0, [None, 7.1, None])
+    store.close()
+    table = read_store(base)
+    assert list(table) == ["Reaction time", "Injections", "pH", "Temperature"]
+    assert list(table["Reaction time"]) == [0.0, 5.0]
+    assert list(table["pH"]) == [7.0, 7.1]
+    assert math.isnan(table["Temperature"][1])
+    assert store_started(base) is not None
+
+def test_chunks_and_continuing_a_session(tmp_path):
+    base = str(tmp_path / "Session")
+    store = SessionStore(base, HEADERS, chunk_rows=4)
+    for i in range(6):
+        store.append(float(i), [None, 7.0 + i / 10, None])
+    store.close()
+    assert len(chunk_paths(base)) == 2
+    # A torn row from a crash is dropped when the session goes on
+    with open(chunk_paths(base)[-1], "ab") as f:
+        f.write(b"\0" * 5)
+    store = SessionStore(base, HEADERS, chunk_rows=4)
+    store.append(6.0, [None, 7.6, None])
+    store.close()
+    table = read_store(base)
+    assert list(table["Reaction time"]) == [float(i) for i in range(7)]
+    assert np.allclose(table["pH"], [7.0 + i / 10 for i in range(7)])
+
+def test_empty_or_missing_store(tmp_path):
+    assert read_store(str(tmp_path / "Nothing")) == {}
+    base = str(tmp_path / "Session")
+    SessionStore(base, HEADERS).close()
+    table = read_store(base)
+    assert len(table["Reaction time"]) == 0
+    assert os.path.exists(chunk_paths(base)[0])
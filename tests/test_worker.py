@@ -0,0 +1,38 @@
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("pyqtgraph")
+
+from scripts.pHStat_control import PIDController
+from scripts.pHStat_worker import StatWorker, Sample, QUALITY_OK
+
+def make_worker():
+    pid = PIDController(kp=0.0, ki=1.0, kd=0.0, min_dose=0.0, max_dose=100.0)
+    # Keep above pH 7 with the pump on channel 1
+    worker = StatWorker(0, 7.0, 6.5, {1: pid, -1: pid}, 5.0)
+    doses = []
+    worker.dose_signal.connect(lambda channel, seconds: doses.append((channel, seconds)))
+    return worker, pid, doses
+
+def sample(worker, value, seq, timestamp):
+    worker.update_pH(Sample("pH", 1, value, None, seq, timestamp, QUALITY_OK))
+
+def test_pid_does_not_integrate_while_idle():
+    worker, pid, doses = make_worker()
+    for seq in range(1, 10):
+        sample(worker, 6.5, seq, seq * 10.0)
+    assert pid.integral == 0.0
+    assert doses == []
+
+def test_dose_counts_only_once_the_pump_started_it():
+    worker, pid, doses = make_worker()
+    worker.start_processing()
+    sample(worker, 6.5, 1, 0.0)
+    sample(worker, 6.5, 2, 1.0)
+    assert doses and worker.pending
+    channel = doses[-1][0]
+    worker.pump_dropped(channel, False)
+    assert not worker.pending and worker.ready_time == 0.0
+    sample(worker, 6.5, 3, 2.0)
+    worker.pump_started(channel, False)
+    assert not worker.pending and worker.response.track is not None